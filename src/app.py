@@ -1,17 +1,41 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.exceptions import ResponseHandlingException
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MatchText
+import time
+
+# モジュールのインポート時間を計測（起動時間の確認用）
+_import_started_at = time.perf_counter()
+
 from dotenv import load_dotenv
 import os
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Callable, Annotated, TYPE_CHECKING
+from collections import OrderedDict
 from enum import Enum
+from dataclasses import dataclass
+from abc import ABC, abstractmethod
 import logging
-import httpx
 import asyncio
 import re
+import bisect
+import unicodedata
+import json
+import socket
+import sys
+import sqlite3
+import threading
+import math
+import uuid
+import hashlib
+import hmac
+from contextvars import ContextVar, copy_context
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+
+# qdrant_client・httpx・numpyはインポートに時間がかかるため、使用時に遅延インポートする
+if TYPE_CHECKING:
+    import httpx
+    from qdrant_client import QdrantClient
 
 load_dotenv()
 
@@ -52,61 +76,728 @@ def remove_metadata_from_section(text: str) -> str:
     # パターンが見つからない場合は元のテキストを返す
     return text.strip()
 
-# CORS設定
-cors_origins_str = os.environ.get("CORS_ORIGINS", "*")
-cors_origins = cors_origins_str.split(",") if cors_origins_str != "*" else ["*"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=cors_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["*"],  # レスポンスヘッダーを公開
-)
+_qdrant_client: Optional["QdrantClient"] = None
+# ローカルモード（QdrantClient(path=...)）のクライアント（ストレージのパスごとに1つ）
+_local_qdrant_clients: Dict[str, "QdrantClient"] = {}
+_local_qdrant_lock = threading.Lock()
+_http_client: Optional["httpx.AsyncClient"] = None
+
+def qdrant_response_error():
+    """QdrantのAPIエラー例外クラスを返す（except節で遅延インポートするため）"""
+    from qdrant_client.http.exceptions import ResponseHandlingException
+    return ResponseHandlingException
+
+def is_qdrant_node_failure(error: Exception) -> bool:
+    """ノード側の障害（接続エラー・タイムアウト・5xx）か。リクエスト自体の誤り（4xx）はFalse"""
+    from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+    if isinstance(error, ResponseHandlingException):
+        return True
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code >= 500
+
+    # gRPC（QDRANT_PREFER_GRPC）の場合
+    code = getattr(error, "code", None)
+    if callable(code):
+        import grpc
+
+        return isinstance(error, grpc.RpcError) and code() in (
+            grpc.StatusCode.UNAVAILABLE,
+            grpc.StatusCode.DEADLINE_EXCEEDED,
+            grpc.StatusCode.INTERNAL,
+        )
+    return False
 
-def get_points_from_ids(point_ids, collection_name, with_payload=True, with_vectors=False):
+class QdrantRouter:
+    """複数のQdrantエンドポイントに読み取りを分散するクライアント
+
+    QdrantClientと同じメソッドを提供し、呼び出しごとに未完了のリクエストが最も少ないノードを選ぶ。
+    ノードの障害はノードごとのサーキットブレーカーで記録し（パッシブヘルスチェック）、
+    openのノードには振り分けない。冪等な読み取りは障害時に別のノードで再試行する。
+    """
+
+    # 別のノードで再試行してよい（冪等な）読み取りメソッド
+    READ_METHODS = {
+        "retrieve", "scroll", "count", "facet", "query_points", "query_batch_points", "search",
+        "get_collection", "get_collections", "collection_exists",
+    }
+
+    def __init__(self, urls: List[str], api_key: Optional[str] = None, **kwargs):
+        from qdrant_client import QdrantClient
+
+        failure_threshold = int(os.getenv("QDRANT_NODE_FAILURE_THRESHOLD", "3"))
+        recovery_timeout = float(os.getenv("QDRANT_NODE_RECOVERY", "10"))
+        self._nodes = [
+            {
+                "url": url,
+                "client": QdrantClient(url=url, api_key=api_key, **kwargs),
+                "breaker": CircuitBreaker(failure_threshold, recovery_timeout),
+                "outstanding": 0,
+            }
+            for url in urls
+        ]
+        self._lock = threading.Lock()
+        self._turn = 0
+
+    def _acquire(self, exclude: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """未完了のリクエストが最も少ない利用可能なノードを選ぶ（すべてopenの場合はopenのノードも使用する）"""
+        with self._lock:
+            # 未完了数が同じノードは順番に選ぶ
+            self._turn = (self._turn + 1) % len(self._nodes)
+            nodes = self._nodes[self._turn:] + self._nodes[:self._turn]
+            candidates = [node for node in nodes if node not in exclude] or nodes
+            candidates = sorted(candidates, key=lambda node: node["outstanding"])
+            node = next((node for node in candidates if node["breaker"].allow()), candidates[0])
+            node["outstanding"] += 1
+            return node
+
+    def _call(self, method: str, *args, **kwargs):
+        attempts = len(self._nodes) if method in self.READ_METHODS else 1
+        tried: List[Dict[str, Any]] = []
+        while True:
+            node = self._acquire(tried)
+            tried.append(node)
+            try:
+                result = getattr(node["client"], method)(*args, **kwargs)
+            except Exception as e:
+                if not is_qdrant_node_failure(e):
+                    node["breaker"].record_success()
+                    raise
+                node["breaker"].record_failure()
+                remaining = remaining_time()
+                if len(tried) >= attempts or (remaining is not None and remaining <= 0):
+                    raise
+                logger.warning(f"Qdrant node {node['url']} failed on {method}, retrying on another node: {e}")
+                continue
+            finally:
+                with self._lock:
+                    node["outstanding"] -= 1
+            node["breaker"].record_success()
+            return result
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+
+    def status(self) -> List[Dict[str, Any]]:
+        """ノードごとの状態（/readyz用）"""
+        return [
+            {"url": node["url"], "circuit": node["breaker"].state, "outstanding": node["outstanding"]}
+            for node in self._nodes
+        ]
+
+def get_qdrant_client(collection_name: Optional[str] = None) -> "QdrantClient":
+    """Qdrantクライアントを取得する（プロセス内で共有し、コネクションプールを再利用する）
+
+    collection_nameにローカルストレージ（COLLECTION_<キー>_PATH）が設定されている場合は、
+    ネットワークを介さないローカルモードのクライアントを返す。
+    """
+    local_path = get_local_path(collection_name) if collection_name else None
+    if local_path:
+        return get_local_qdrant_client(local_path)
+
+    global _qdrant_client
+    if _qdrant_client is None:
+        # QDRANT_URLにカンマ区切りで複数指定した場合は、読み取りを各エンドポイントに分散する
+        urls = [url.strip() for url in os.getenv("QDRANT_URL", "").split(",") if url.strip()]
+        if len(urls) > 1:
+            _qdrant_client = QdrantRouter(urls, api_key=os.getenv("QDRANT_API_KEY"), **qdrant_transport_options())
+        else:
+            from qdrant_client import QdrantClient
+
+            _qdrant_client = QdrantClient(
+                url=os.getenv("QDRANT_URL"),
+                api_key=os.getenv("QDRANT_API_KEY"),
+                **qdrant_transport_options(),
+            )
+    return _qdrant_client
+
+def qdrant_transport_options(prefer_grpc: Optional[bool] = None) -> Dict[str, Any]:
+    """QdrantClientの通信方式の設定（QDRANT_PREFER_GRPC=trueの場合はgRPCを使用する）
+
+    RESTではリクエストごとのtimeoutはサーバー側のタイムアウトとしてのみ渡され、HTTPクライアントの
+    タイムアウトはQDRANT_CLIENT_TIMEOUTのままになる。応答しないノードで期限切れ（504）後もスレッドが
+    占有され続けないよう、QDRANT_CLIENT_TIMEOUTはルートの期限に合わせて短くする。
+    """
+    if prefer_grpc is None:
+        prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+    return {
+        "timeout": int(os.getenv("QDRANT_CLIENT_TIMEOUT", "15")),
+        "prefer_grpc": prefer_grpc,
+        "grpc_port": int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+    }
+
+def get_local_qdrant_client(path: str) -> "QdrantClient":
+    """ローカルモードのQdrantクライアントを取得する（初回はストレージの読み込みに時間がかかる）"""
+    with _local_qdrant_lock:
+        client = _local_qdrant_clients.get(path)
+        if client is None:
+            from qdrant_client import QdrantClient
+
+            started_at = time.perf_counter()
+            client = QdrantClient(path=path)
+            _local_qdrant_clients[path] = client
+            logger.info(f"Opened local Qdrant storage {path} in {(time.perf_counter() - started_at) * 1000:.0f} ms")
+        return client
+
+def get_local_path(collection_name: str) -> Optional[str]:
+    """実コレクション名に対応するローカルストレージのパスを返す（リモートのQdrantを使用する場合はNone）"""
+    for collection in CollectionName:
+        if collection.get_actual_name() == collection_name:
+            return collection.get_local_path()
+    return None
+
+def get_http_client() -> "httpx.AsyncClient":
+    """医薬品URL取得API用のHTTPクライアントを取得する（プロセス内で共有し、コネクションを再利用する）"""
+    global _http_client
+    if _http_client is None:
+        import httpx
+
+        _http_client = httpx.AsyncClient()
+    return _http_client
+
+class CacheBackend(ABC):
+    """URL・レスポンスキャッシュのバックエンドインターフェース
+
+    キャッシュの失敗でリクエストを失敗させないよう、実装はエラー時にミスとして扱う。
+    """
+
+    # get / set がブロッキングI/O（SQLite・ソケット）を行うか。Trueの場合、イベントループからは cache_io で呼び出す
+    blocking = False
+
+    @abstractmethod
+    def get(self, key: Any, default: Any = None) -> Any:
+        ...
+
+    def get_many(self, keys: List[Any]) -> Dict[Any, Any]:
+        """キャッシュにあるキーのみを辞書で返す"""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    @abstractmethod
+    def set(self, key: Any, value: Any):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def invalidate(self, match: Callable[[Any], bool]):
+        """match(キー)がTrueのエントリを削除する（タプルのキーは共有バックエンドではリストとして渡される）"""
+
+class TTLCache(CacheBackend):
+    """TTL付きLRUキャッシュ（プロセス内）"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        # ワーカースレッド（asyncio.to_thread）からも参照されるためロックで保護する
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, match: Callable[[Any], bool]):
+        with self._lock:
+            for key in [key for key in self._entries if match(key)]:
+                del self._entries[key]
+
+async def cache_io(cache: CacheBackend, func: Callable, *args) -> Any:
+    """キャッシュの操作をイベントループから呼び出す（共有バックエンドの場合はスレッドで実行する）"""
+    if cache.blocking:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+def _cache_key(key: Any) -> str:
+    """キャッシュキー（文字列またはタプル）をプロセス間で共有できる文字列に変換する"""
+    return key if isinstance(key, str) else json.dumps(key, ensure_ascii=False)
+
+def _parse_cache_key(key: str) -> Any:
+    """_cache_keyで変換したキーを元に戻す（タプルはリストになる）"""
     try:
-        client = QdrantClient(
-            url=os.getenv("QDRANT_URL"),
-            api_key=os.getenv("QDRANT_API_KEY"),    
-            timeout=60,
+        return json.loads(key)
+    except ValueError:
+        return key
+
+class SQLiteCacheBackend(CacheBackend):
+    """SQLiteファイルを用いたキャッシュ（同一ホスト上の複数ワーカーで共有）
+
+    値はJSONで保存する。WALモードで読み込みと書き込みを並行させる。
+    """
+
+    _PRUNE_EVERY = 500
+    blocking = True
+
+    def __init__(self, path: str, namespace: str, ttl: float, max_entries: int):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (namespace, expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3の接続はスレッド間で共有できないため、スレッドごとに接続する
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (self.namespace, _cache_key(key), time.time()),
+            ).fetchone()
+        except Exception as e:
+            logger.warning(f"SQLite cache get failed: {e}")
+            return default
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: Any, value: Any):
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, _cache_key(key), json.dumps(value, ensure_ascii=False, default=_json_default), time.time() + self.ttl),
+            )
+            self._writes += 1
+            if self._writes % self._PRUNE_EVERY == 0:
+                self._prune(conn)
+        except Exception as e:
+            logger.warning(f"SQLite cache set failed: {e}")
+
+    def _prune(self, conn: sqlite3.Connection):
+        """期限切れのエントリを削除し、上限を超えた分は期限の近い順に削除する"""
+        conn.execute("DELETE FROM cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time()))
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries),
         )
-        
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+        except Exception as e:
+            logger.warning(f"SQLite cache clear failed: {e}")
+
+    def invalidate(self, match: Callable[[Any], bool]):
+        try:
+            conn = self._connection()
+            keys = [row[0] for row in conn.execute("SELECT key FROM cache WHERE namespace = ?", (self.namespace,))]
+            conn.executemany(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                [(self.namespace, key) for key in keys if match(_parse_cache_key(key))],
+            )
+        except Exception as e:
+            logger.warning(f"SQLite cache invalidate failed: {e}")
+
+class RedisCacheBackend(CacheBackend):
+    """Redisプロトコル（RESP）を話すサーバーを用いたキャッシュ（複数ホストのワーカーで共有）
+
+    追加の依存関係を避けるため、GET / SET / SCAN / DEL のみを実装した最小限のクライアントを使用する。
+    """
+
+    blocking = True
+
+    def __init__(self, url: str, namespace: str, ttl: float):
+        from urllib.parse import urlparse
+
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = f"qdrant-point-api:{namespace}:"
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=1.0)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+            try:
+                if self.password:
+                    self._command("AUTH", self.password)
+                if self.db:
+                    self._command("SELECT", str(self.db))
+            except Exception:
+                # 認証・DB選択に失敗した接続は使用しない（次回接続し直す）
+                self._local.conn = None
+                sock.close()
+                raise
+        return conn
+
+    def _read_reply(self, reader) -> Any:
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by cache server")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            raise RuntimeError(body.decode())
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read_reply(reader) for _ in range(length)]
+        raise RuntimeError(f"Unexpected reply from cache server: {line!r}")
+
+    def _command(self, *args: str) -> Any:
+        try:
+            sock, reader = self._connection()
+            encoded = [arg.encode() for arg in args]
+            sock.sendall(b"*%d\r\n" % len(encoded) + b"".join(b"$%d\r\n%s\r\n" % (len(arg), arg) for arg in encoded))
+            return self._read_reply(reader)
+        except (OSError, ConnectionError):
+            # 接続が切れた場合は次回再接続する
+            self._local.conn = None
+            raise
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        try:
+            value = self._command("GET", self.prefix + _cache_key(key))
+        except Exception as e:
+            logger.warning(f"Redis cache get failed: {e}")
+            return default
+        return json.loads(value) if value is not None else default
+
+    def set(self, key: Any, value: Any):
+        try:
+            self._command("SET", self.prefix + _cache_key(key), json.dumps(value, ensure_ascii=False, default=_json_default), "PX", str(int(self.ttl * 1000)))
+        except Exception as e:
+            logger.warning(f"Redis cache set failed: {e}")
+
+    def clear(self):
+        try:
+            cursor = "0"
+            while True:
+                cursor, keys = self._command("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", "1000")
+                cursor = cursor.decode()
+                if keys:
+                    self._command("DEL", *[key.decode() for key in keys])
+                if cursor == "0":
+                    break
+        except Exception as e:
+            logger.warning(f"Redis cache clear failed: {e}")
+
+    def invalidate(self, match: Callable[[Any], bool]):
+        try:
+            cursor = "0"
+            while True:
+                cursor, keys = self._command("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", "1000")
+                cursor = cursor.decode()
+                matched = [key.decode() for key in keys if match(_parse_cache_key(key.decode()[len(self.prefix):]))]
+                if matched:
+                    self._command("DEL", *matched)
+                if cursor == "0":
+                    break
+        except Exception as e:
+            logger.warning(f"Redis cache invalidate failed: {e}")
+
+def create_cache(namespace: str, ttl: float, max_entries: int) -> CacheBackend:
+    """CACHE_BACKEND（memory / sqlite / redis）に応じたキャッシュを作成する"""
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteCacheBackend(os.getenv("CACHE_SQLITE_PATH", "/tmp/qdrant_point_api_cache.sqlite3"), namespace, ttl, max_entries)
+    if backend == "redis":
+        return RedisCacheBackend(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"), namespace, ttl)
+    return TTLCache(ttl=ttl, max_entries=max_entries)
+
+# YJコード → ドキュメントURLリスト
+drug_url_cache = create_cache("drug_url", ttl=float(os.getenv("DRUG_URL_CACHE_TTL", "86400")), max_entries=20000)
+# (実コレクション名, ポイントID) → ポイント（payloadのみ、vectorなし）
+point_cache = create_cache("point", ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")), max_entries=50000)
+# (種別, 実コレクション名, パラメータ...) → 変換済みレスポンスデータ
+response_cache = create_cache("response", ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")), max_entries=5000)
+
+class AccessRecorder:
+    """アクセスの多いキー（YJコード・章・ポイントID）を記録し、ウォームアップ用に永続化する
+
+    前回起動時に保存したキーは重みを半減して引き継ぐため、最近のアクセスほど優先される。
+    """
+
+    def __init__(self, path: Optional[str], top_n: int):
+        self.path = path
+        self.top_n = top_n
+        self._counts: Counter = Counter()
+        self._merged = False  # 保存済みの件数の引き継ぎ（最初のload）を行ったか
+
+    def record(self, kind: str, key: Any):
+        if not self.path:
+            return
+        self._counts[(kind, key)] += 1
+        # メモリ使用量を抑えるため、候補が増えすぎたら上位のみ残す
+        if len(self._counts) > self.top_n * 10:
+            self._counts = Counter(dict(self._counts.most_common(self.top_n * 2)))
+
+    def load(self) -> List[tuple]:
+        """保存済みのキーを読み込み、(種別, キー) のリストを頻度順で返す
+
+        件数の引き継ぎは最初の読み込み時（起動時）のみ行い、コレクション切り替え時などの
+        再読み込みではキーを返すだけにする（呼び出しごとに件数が加算されないように）。
+        """
+        merge, self._merged = not self._merged, True
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load warm-up keys from {self.path}: {e}")
+            return []
+
+        entries = []
+        for item in data.get("keys", []):
+            key = item["key"]
+            key = tuple(key) if isinstance(key, list) else key
+            entries.append((item["kind"], key))
+            if merge:
+                self._counts[(item["kind"], key)] += item.get("count", 1) / 2
+        return entries
+
+    def save(self):
+        if not self.path:
+            return
+        keys = [
+            {"kind": kind, "key": list(key) if isinstance(key, tuple) else key, "count": count}
+            for (kind, key), count in self._counts.most_common(self.top_n)
+        ]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"updated_at": time.time(), "keys": keys}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Failed to save warm-up keys to {self.path}: {e}")
+
+access_recorder = AccessRecorder(os.getenv("WARMUP_KEYS_PATH"), top_n=int(os.getenv("WARMUP_TOP_N", "500")))
+
+# リクエストの期限（time.monotonic()基準）。期限がない場合はNone
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+def remaining_time() -> Optional[float]:
+    """現在のリクエストの残り時間（秒）を返す。期限がない場合はNone"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def deadline_exceeded() -> HTTPException:
+    return HTTPException(status_code=504, detail="Request deadline exceeded")
+
+def qdrant_timeout() -> Optional[int]:
+    """Qdrantに渡すタイムアウト（秒・整数）を残り時間から計算する。期限切れの場合は504を送出する"""
+    remaining = remaining_time()
+    if remaining is None:
+        return None
+    if remaining <= 0:
+        raise deadline_exceeded()
+    return max(1, math.ceil(remaining))
+
+async def run_with_deadline(func: Callable, *args, **kwargs) -> Any:
+    """同期処理をスレッドで実行し、リクエストの残り時間を過ぎた場合は待たずに504を返す"""
+    remaining = remaining_time()
+    if remaining is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    if remaining <= 0:
+        raise deadline_exceeded()
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(func, *args, **kwargs), timeout=remaining)
+    except asyncio.TimeoutError:
+        raise deadline_exceeded()
+
+# 条件付きリクエストの対象となるリクエストで、レスポンスにETagを付与してよいかを保持する
+# （エンドポイントから書き換えられるよう、ミドルウェアが可変の辞書を設定する）
+response_flags: ContextVar[Optional[Dict[str, bool]]] = ContextVar("response_flags", default=None)
+
+def mark_uncacheable():
+    """現在のレスポンスが入力だけで決まらない（フォールバック・部分的な結果など）ことを記録し、ETagを付与しない"""
+    flags = response_flags.get()
+    if flags is not None:
+        flags["cacheable"] = False
+
+@dataclass(slots=True)
+class PointRecord:
+    """Qdrantから取得したポイントの内部表現
+
+    Qdrantの結果からレスポンスへの変換までこの型で受け渡し、ポイントごとの中間辞書を作らない。
+    vectorは要求された場合のみ保持する。
+    """
+    id: Any
+    payload: Dict[str, Any]
+    vector: Any = None
+
+    @classmethod
+    def from_qdrant(cls, record: Any, with_vectors: bool = False) -> "PointRecord":
+        return cls(record.id, record.payload or {}, record.vector if with_vectors and record.vector else None)
+
+def _json_default(value: Any) -> Any:
+    """共有キャッシュ（SQLite / Redis）に保存する値のJSON変換"""
+    if isinstance(value, PointRecord):
+        return {"id": value.id, "payload": value.payload, "vector": value.vector}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def json_response(content: Dict[str, Any]) -> JSONResponse:
+    """レスポンスをjsonable_encoderを通さずにJSONにする
+
+    ポイントのpayloadはQdrantのJSONから作られておりそのままJSONにできるため、
+    FastAPIによるレスポンス全体の再構築（大量のポイントでは処理時間の大半を占める）を省く。
+    """
+    return JSONResponse(content=content)
+
+# retrieve 1回あたりのID数と、同時に実行するretrieveの数
+RETRIEVE_CHUNK_SIZE = int(os.getenv("RETRIEVE_CHUNK_SIZE", "256"))
+RETRIEVE_CONCURRENCY = int(os.getenv("RETRIEVE_CONCURRENCY", "4"))
+# 分割したretrieveを実行するスレッドプール（全リクエストで共有）
+_retrieve_executor = ThreadPoolExecutor(max_workers=int(os.getenv("RETRIEVE_POOL_SIZE", "32")), thread_name_prefix="retrieve")
+
+def get_points_from_ids(point_ids, collection_name, with_payload=True, with_vectors=False):
+    """ポイントIDでポイントを取得する
+
+    IDは重複を除去し、RETRIEVE_CHUNK_SIZE件ごとに分割して最大RETRIEVE_CONCURRENCY並列で取得する。
+
+    Returns:
+        リクエスト順（重複除去済み）のポイントリスト。存在しないIDは含まない
+    """
+    timeout = qdrant_timeout()
+    try:
+        client = get_qdrant_client(collection_name)
+
         if not point_ids:
             raise ValueError("point_ids cannot be empty")
-        
-        points = client.retrieve(
-            collection_name=collection_name,
-            ids=point_ids,
-            with_payload=with_payload,
-            with_vectors=with_vectors
-        )
-        
-        result = []
-        for point in points:
-            point_dict = {
-                "id": point.id,
-                "payload": point.payload if point.payload else {},
-            }
-            if with_vectors and point.vector:
-                point_dict["vector"] = point.vector
-            result.append(point_dict)
-        
-        return result
+
+        unique_ids = list(dict.fromkeys(point_ids))
+        chunks = [unique_ids[i:i + RETRIEVE_CHUNK_SIZE] for i in range(0, len(unique_ids), RETRIEVE_CHUNK_SIZE)]
+
+        def retrieve(ids):
+            return client.retrieve(
+                collection_name=collection_name,
+                ids=ids,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+                timeout=timeout
+            )
+
+        if len(chunks) == 1:
+            points = retrieve(chunks[0])
+        else:
+            # リクエストの期限（request_deadline）をワーカースレッドに引き継ぐため、コンテキストをコピーして実行する
+            points = []
+            for i in range(0, len(chunks), RETRIEVE_CONCURRENCY):
+                futures = [
+                    _retrieve_executor.submit(copy_context().run, retrieve, chunk)
+                    for chunk in chunks[i:i + RETRIEVE_CONCURRENCY]
+                ]
+                points.extend(point for future in futures for point in future.result())
+
+        found = {point.id: PointRecord.from_qdrant(point, with_vectors) for point in points}
+
+        # retrieveの返却順は不定のため、リクエスト順に並べ直す
+        return [found[point_id] for point_id in unique_ids if point_id in found]
     
-    except ResponseHandlingException as e:
+    except qdrant_response_error() as e:
         logger.error(f"Qdrant API error: {e}")
         raise HTTPException(status_code=400, detail=f"Qdrant API error: {str(e)}")
     except Exception as e:
         logger.error(f"Unexpected error in get_points_from_ids: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def get_points_cached(point_ids, collection_name):
+    """ポイントキャッシュを参照し、未キャッシュのIDのみQdrantから取得する（payloadのみ）
+
+    Returns:
+        リクエスト順（重複除去済み）のポイントリスト
+    """
+    found = {}
+    missing = []
+    for point_id in dict.fromkeys(point_ids):
+        point = point_cache.get((collection_name, point_id))
+        if point is None:
+            missing.append(point_id)
+        else:
+            # 共有キャッシュ（SQLite / Redis）からは辞書として読み込まれる
+            found[point_id] = PointRecord(**point) if isinstance(point, dict) else point
+
+    if missing:
+        for point in get_points_from_ids(missing, collection_name, with_payload=True, with_vectors=False):
+            point_cache.set((collection_name, point.id), point)
+            found[point.id] = point
+
+    return [found[point_id] for point_id in dict.fromkeys(point_ids) if point_id in found]
+
+def load_collection_mapping_file() -> Dict[str, str]:
+    """COLLECTION_MAPPING_PATH（{"CUBEC_NOTE": "実コレクション名", ...} のJSON）を読み込む"""
+    path = os.getenv("COLLECTION_MAPPING_PATH")
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            mapping = json.load(f)
+        return {str(key): str(name) for key, name in mapping.items() if name}
+    except Exception as e:
+        logger.warning(f"Failed to load collection mapping from {path}: {e}")
+        return {}
+
+# 実行時に切り替えた実コレクション名（キー → 実コレクション名）。切り替え時は辞書ごと差し替える
+_collection_overrides: Dict[str, str] = load_collection_mapping_file()
+
 class CollectionName(str, Enum):
     CUBEC_NOTE = "CUBEC_NOTE"
     PACKAGE_INSERT = "PACKAGE_INSERT"
     GUIDELINE = "GUIDELINE"
     
     def get_actual_name(self):
+        override = _collection_overrides.get(self.value)
+        if override:
+            return override
         mapping = {
             "CUBEC_NOTE": os.getenv("COLLECTION_CUBEC_NOTE", "default_cubec_note"),
             "PACKAGE_INSERT": os.getenv("COLLECTION_PACKAGE_INSERT", "default_package_insert"),
@@ -114,11 +805,318 @@ class CollectionName(str, Enum):
         }
         return mapping.get(self.value)
 
-class PointRequest(BaseModel):
+    def get_local_path(self) -> Optional[str]:
+        """ローカルモードで読み込むQdrantストレージのパス（COLLECTION_<キー>_PATH）。未設定の場合はリモートのQdrantを使用する"""
+        return os.getenv(f"COLLECTION_{self.value}_PATH") or None
+
+# APIのフィルター検索が前提とするペイロードインデックス（コレクション → フィールド → スキーマ）
+REQUIRED_PAYLOAD_INDEXES: Dict[CollectionName, Dict[str, str]] = {
+    CollectionName.CUBEC_NOTE: {
+        "metadata.main_category": "text",
+        "metadata.disease_name": "text",
+        "page_content": "text:multilingual",
+    },
+    CollectionName.PACKAGE_INSERT: {
+        "metadata.yj_code": "text",
+        "metadata.section_title": "keyword",
+        "page_content": "text:multilingual",
+    },
+}
+
+def check_payload_indexes(create_missing: bool = False) -> Dict[str, List[str]]:
+    """各コレクションのペイロードスキーマを確認し、不足しているインデックスを返す
+
+    Args:
+        create_missing: Trueの場合、不足しているインデックスを作成する
+
+    Returns:
+        実コレクション名をキーとした、インデックスが不足している（または型が異なる）フィールドのリスト
+        （作成に成功したフィールドは含まない）
+    """
+    missing: Dict[str, List[str]] = {}
+
+    for collection, required in REQUIRED_PAYLOAD_INDEXES.items():
+        # ローカルモードではペイロードインデックスを使用しない（全件を走査する）ため確認しない
+        if collection.get_local_path():
+            continue
+
+        collection_name = collection.get_actual_name()
+        client = get_qdrant_client(collection_name)
+        try:
+            payload_schema = client.get_collection(collection_name).payload_schema or {}
+        except Exception as e:
+            logger.warning(f"Failed to inspect payload schema of {collection_name}: {e}")
+            missing[collection_name] = list(required.keys())
+            continue
+
+        for field, schema in required.items():
+            # "text:multilingual" のようにtext型はトークナイザーを指定できる
+            data_type, _, tokenizer = schema.partition(":")
+            index_info = payload_schema.get(field)
+            if (
+                index_info is not None
+                and index_info.data_type == data_type
+                and (not tokenizer or getattr(index_info.params, "tokenizer", None) == tokenizer)
+            ):
+                continue
+
+            if index_info is not None:
+                logger.warning(f"Payload index type mismatch on {collection_name}.{field}: {index_info.data_type} (expected {schema})")
+
+            if create_missing:
+                try:
+                    from qdrant_client.http.models import PayloadSchemaType, TextIndexParams, TokenizerType
+
+                    if tokenizer:
+                        field_schema = TextIndexParams(type="text", tokenizer=TokenizerType(tokenizer), lowercase=True)
+                    else:
+                        field_schema = PayloadSchemaType(data_type)
+                    client.create_payload_index(collection_name=collection_name, field_name=field, field_schema=field_schema, wait=True)
+                    logger.info(f"Created {schema} payload index on {collection_name}.{field}")
+                    continue
+                except Exception as e:
+                    logger.error(f"Failed to create payload index on {collection_name}.{field}: {e}")
+
+            missing.setdefault(collection_name, []).append(field)
+
+    return missing
+
+class EnrichUrlsMode(str, Enum):
+    SYNC = "sync"          # URLを取得してからレスポンスを返す（従来の動作）
+    OFF = "off"            # URLを取得しない（payloadのurlのみ）
+    DEFERRED = "deferred"  # URL取得をバックグラウンドで開始し、トークンを返す
+
+class RerankMode(str, Enum):
+    MMR = "mmr"
+    DEDUP = "dedup"
+
+class RerankOptions(BaseModel):
+    """再ランキング（多様化）オプション
+
+    - rerank: "mmr"（Maximal Marginal Relevance）または "dedup"（類似度しきい値による重複除去）
+    - rerank_top_k: 返却する最大件数（未指定の場合はmmrでは全件を並べ替え、dedupでは除去のみ）
+    - rerank_lambda: MMRの関連度と多様性の重み（1.0で関連度のみ、0.0で多様性のみ）
+    - rerank_threshold: dedupで同一とみなすコサイン類似度のしきい値
+    - query_vector: 関連度計算に用いるクエリベクトル（未指定の場合は取得順を関連度とする）
+    """
+    rerank: Optional[RerankMode] = None
+    rerank_top_k: Optional[int] = Field(default=None, ge=1)
+    rerank_lambda: Optional[float] = Field(default=0.5, ge=0, le=1)
+    rerank_threshold: Optional[float] = Field(default=0.95, ge=0, le=1)
+    query_vector: Optional[List[float]] = None
+
+class PointRequest(RerankOptions):
     point_ids: List[int]
     collection_name: CollectionName = CollectionName.CUBEC_NOTE
     with_payload: Optional[bool] = True
     with_vectors: Optional[bool] = False
+    enrich_urls: EnrichUrlsMode = EnrichUrlsMode.SYNC
+    compact: Optional[bool] = False
+    report_missing: Optional[bool] = False
+
+@app.on_event("startup")
+async def verify_payload_indexes():
+    """起動時にフィルター検索用のペイロードインデックスを確認する
+
+    PAYLOAD_INDEX_CHECK:
+        off    - 確認しない
+        warn   - 不足しているインデックスを警告ログに出力する（デフォルト）
+        create - 不足しているインデックスを作成する
+        strict - 不足しているインデックスがあれば起動を中止する
+    """
+    mode = os.getenv("PAYLOAD_INDEX_CHECK", "warn").lower()
+    if mode == "off":
+        return
+
+    async def check():
+        missing = await asyncio.to_thread(check_payload_indexes, mode == "create")
+        for collection_name, fields in missing.items():
+            logger.warning(f"Missing payload indexes on {collection_name}: {', '.join(fields)} (filters on these fields fall back to full scans)")
+        return missing
+
+    if mode != "strict":
+        # 起動を遅らせないようバックグラウンドで確認する
+        app.state.payload_index_check_task = asyncio.create_task(check())
+        return
+
+    missing = await check()
+    if missing:
+        raise RuntimeError(f"Missing payload indexes: {missing}")
+
+@app.on_event("startup")
+async def prefill_facet_cache():
+    """CUBEC_NOTEのファセット集計をバックグラウンドで事前に読み込む"""
+    async def prefill():
+        try:
+            await get_cubec_note_facets()
+        except Exception as e:
+            logger.warning(f"Failed to prefill facet cache: {e}")
+
+    app.state.facet_prefill_task = asyncio.create_task(prefill())
+
+@app.on_event("startup")
+async def open_local_collections():
+    """ローカルモードのコレクションのストレージをバックグラウンドで読み込む（読み込みが完了するまで/readyzは応答を待つ）"""
+    async def open_all():
+        for collection in CollectionName:
+            if collection.get_local_path():
+                try:
+                    await asyncio.to_thread(get_qdrant_client, collection.get_actual_name())
+                except Exception as e:
+                    logger.error(f"Failed to open local Qdrant storage for {collection.value}: {e}")
+
+    app.state.local_collections_task = asyncio.create_task(open_all())
+
+@app.on_event("startup")
+async def start_autocomplete_index():
+    """オートコンプリート用インデックスを構築し、コレクションの変化を定期的に確認する"""
+    interval = float(os.getenv("AUTOCOMPLETE_REFRESH_INTERVAL", "600"))
+    retry_interval = float(os.getenv("AUTOCOMPLETE_RETRY_INTERVAL", "30"))
+
+    async def refresh_loop():
+        while True:
+            await autocomplete_index.refresh()
+            # 構築に失敗したコレクションがある場合は短い間隔で再試行する
+            await asyncio.sleep(interval if autocomplete_index.ready else min(interval, retry_interval))
+
+    app.state.autocomplete_refresh_task = asyncio.create_task(refresh_loop())
+
+async def warm_up_caches(collection_names: Optional[Dict[CollectionName, str]] = None):
+    """保存済みのアクセス上位キーを用いてURL・レスポンスキャッシュを事前に読み込む
+
+    Args:
+        collection_names: 指定した場合は、そのコレクション（切り替え先の実コレクション名）の
+            レスポンス・ポイントキャッシュのみを読み込む
+    """
+    entries = access_recorder.load()
+    if not entries:
+        return
+
+    names = collection_names or {collection: collection.get_actual_name() for collection in CollectionName}
+
+    semaphore = asyncio.Semaphore(int(os.getenv("WARMUP_CONCURRENCY", "8")))
+
+    async def run(label: str, func, *args):
+        async with semaphore:
+            try:
+                result = func(*args)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"Warm-up failed for {label}: {e}")
+
+    tasks = []
+    point_ids: Dict[CollectionName, List[Any]] = {}
+    for kind, key in entries:
+        if kind == "yj_code":
+            # URLキャッシュはコレクションに依存しない
+            if collection_names is None:
+                tasks.append(run(f"yj_code {key}", fetch_and_cache_drug_urls, key))
+        elif kind == "chapter":
+            if CollectionName.CUBEC_NOTE in names:
+                tasks.append(run(f"chapter {key}", asyncio.to_thread, get_cubec_note_chapter_cached, *key, names[CollectionName.CUBEC_NOTE]))
+        elif kind == "point":
+            collection = CollectionName(key[0])
+            if collection in names:
+                point_ids.setdefault(collection, []).append(key[1])
+
+    # ポイントIDはコレクションごとにまとめて取得する
+    for collection, ids in point_ids.items():
+        for i in range(0, len(ids), 100):
+            tasks.append(run(f"points {collection.value}", asyncio.to_thread, get_points_cached, ids[i:i + 100], names[collection]))
+
+    started = time.monotonic()
+    await asyncio.gather(*tasks)
+    logger.info(f"Warmed up caches with {len(entries)} keys in {time.monotonic() - started:.1f}s")
+
+@app.on_event("startup")
+async def start_cache_warm_up():
+    """起動時にキャッシュをウォームアップし、アクセス上位キーを定期的に保存する
+
+    ウォームアップはバックグラウンドで実行し、完了（またはWARMUP_TIMEOUTを経過）するまで
+    /readyz は503を返す。
+    """
+    app.state.warmup_done = not access_recorder.path
+    if not access_recorder.path:
+        return
+
+    async def warm_up():
+        try:
+            await asyncio.wait_for(warm_up_caches(), timeout=float(os.getenv("WARMUP_TIMEOUT", "60")))
+        except asyncio.TimeoutError:
+            logger.warning("Cache warm-up timed out")
+        except Exception as e:
+            logger.warning(f"Cache warm-up failed: {e}")
+        finally:
+            app.state.warmup_done = True
+
+    interval = float(os.getenv("WARMUP_PERSIST_INTERVAL", "300"))
+
+    async def persist_loop():
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(access_recorder.save)
+
+    app.state.warmup_task = asyncio.create_task(warm_up())
+    app.state.warmup_persist_task = asyncio.create_task(persist_loop())
+
+@app.on_event("shutdown")
+async def save_access_keys():
+    await asyncio.to_thread(access_recorder.save)
+
+@app.on_event("shutdown")
+async def close_http_client():
+    if _http_client is not None:
+        await _http_client.aclose()
+
+def check_collections() -> Dict[str, Any]:
+    """READINESS_COLLECTIONSの各コレクションにアクセスできるか確認する（Qdrantへのコネクションもここで確立される）"""
+    status = {}
+    for key in os.getenv("READINESS_COLLECTIONS", "CUBEC_NOTE,PACKAGE_INSERT").split(","):
+        collection = CollectionName(key.strip())
+        collection_name = collection.get_actual_name()
+        try:
+            info = get_qdrant_client(collection_name).get_collection(collection_name)
+            status[collection.value] = {"name": collection_name, "status": info.status}
+        except Exception as e:
+            status[collection.value] = {"name": collection_name, "error": str(e)}
+    return status
+
+@app.get("/healthz")
+async def healthz():
+    """ライブネスプローブ（プロセスが応答できるかのみを返し、外部サービスには接続しない）"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """レディネスプローブ
+
+    Qdrantの各コレクションへのアクセス（コネクションプールのウォームアップを兼ねる）、
+    医薬品URL取得API用HTTPクライアントの初期化、キャッシュのウォームアップ完了を確認する。
+    """
+    checked_at = getattr(app.state, "ready_checked_at", None)
+    if checked_at is not None and time.monotonic() - checked_at < float(os.getenv("READINESS_CACHE_SECONDS", "10")):
+        return {"status": "ready"}
+
+    get_http_client()
+    collections = await asyncio.to_thread(check_collections)
+    warmup_done = getattr(app.state, "warmup_done", True)
+    ready = warmup_done and all("error" not in status for status in collections.values())
+
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "warmup_done": warmup_done,
+        "collections": collections,
+        "drug_api_circuit": drug_api_breaker.state,
+    }
+    if isinstance(_qdrant_client, QdrantRouter):
+        body["qdrant_nodes"] = _qdrant_client.status()
+    if not ready:
+        app.state.ready_checked_at = None
+        return JSONResponse(status_code=503, content=body)
+
+    app.state.ready_checked_at = time.monotonic()
+    return body
 
 @app.options("/api")
 async def options_api():
@@ -135,6 +1133,133 @@ async def get_available_collections():
         ]
     }
 
+_collection_switch_lock = asyncio.Lock()
+
+def invalidate_collection_caches(collection_name: str):
+    """実コレクション名をキーに含むポイント・レスポンス・ファセットキャッシュのエントリを削除する"""
+    def match(key: Any) -> bool:
+        return isinstance(key, (list, tuple)) and collection_name in key[:2]
+
+    point_cache.invalidate(match)
+    response_cache.invalidate(match)
+    facet_cache.invalidate(match)
+    _yj_codes_index_cache.pop(collection_name, None)
+
+async def switch_collections(collection_names: Dict[CollectionName, str]) -> Dict[str, Dict[str, str]]:
+    """実コレクション名を再起動なしで切り替える
+
+    切り替え先のコレクションを確認してキャッシュを事前に読み込んでから、対応表を一括で差し替え、
+    切り替えたコレクションのキャッシュのみを削除する。他のコレクションのキャッシュとコネクションはそのまま使用する。
+
+    Returns:
+        切り替えたコレクションごとの {"from": 旧実コレクション名, "to": 新実コレクション名}
+    """
+    global _collection_overrides
+
+    async with _collection_switch_lock:
+        changed = {
+            collection: name for collection, name in collection_names.items()
+            if name and name != collection.get_actual_name()
+        }
+        if not changed:
+            return {}
+
+        # 切り替え先のコレクションが存在することを確認する
+        for collection, name in changed.items():
+            local_path = collection.get_local_path()
+            client = get_local_qdrant_client(local_path) if local_path else get_qdrant_client()
+            try:
+                await asyncio.to_thread(client.get_collection, name)
+            except Exception as e:
+                raise ValueError(f"Collection {name} is not available: {e}")
+
+        # 切り替え先のキャッシュを事前に読み込む
+        try:
+            await asyncio.wait_for(warm_up_caches(changed), timeout=float(os.getenv("WARMUP_TIMEOUT", "60")))
+            if CollectionName.CUBEC_NOTE in changed:
+                name = changed[CollectionName.CUBEC_NOTE]
+                await facet_cache.get(("cubec_note", name), lambda: load_cubec_note_facets(name))
+            if CollectionName.PACKAGE_INSERT in changed:
+                await asyncio.to_thread(has_yj_codes_index, changed[CollectionName.PACKAGE_INSERT])
+        except Exception as e:
+            logger.warning(f"Warm-up before switching collections failed: {e}")
+
+        # 対応表を一括で差し替え、旧コレクションのキャッシュを削除する
+        previous = {collection: collection.get_actual_name() for collection in changed}
+        _collection_overrides = {**_collection_overrides, **{collection.value: name for collection, name in changed.items()}}
+        for name in previous.values():
+            await asyncio.to_thread(invalidate_collection_caches, name)
+        app.state.ready_checked_at = None
+        logger.info("Switched collections: " + ", ".join(f"{c.value} {previous[c]} -> {name}" for c, name in changed.items()))
+
+        await autocomplete_index.refresh()
+        return {collection.value: {"from": previous[collection], "to": name} for collection, name in changed.items()}
+
+def require_admin(request: Request):
+    """管理用エンドポイントの認証（ADMIN_TOKENが未設定の場合は管理用エンドポイントを無効にする）"""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+class CollectionMappingRequest(BaseModel):
+    collections: Dict[CollectionName, str]
+
+@app.post("/admin/collections")
+async def update_collections(body: CollectionMappingRequest, request: Request):
+    """実コレクション名を再起動なしで切り替える（X-Admin-Tokenが必要）"""
+    require_admin(request)
+    try:
+        switched = await switch_collections(body.collections)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    current = {collection.value: collection.get_actual_name() for collection in CollectionName}
+
+    # 他のワーカーも切り替わるよう、対応表ファイルに書き込む
+    path = os.getenv("COLLECTION_MAPPING_PATH")
+    if path and switched:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    return {"success": True, "data": switched, "collections": current}
+
+@app.on_event("startup")
+async def watch_collection_mapping():
+    """COLLECTION_MAPPING_PATHの変更を定期的に確認し、変更があれば実コレクション名を切り替える"""
+    path = os.getenv("COLLECTION_MAPPING_PATH")
+    if not path:
+        return
+    interval = float(os.getenv("COLLECTION_MAPPING_RELOAD_INTERVAL", "30"))
+
+    def mtime() -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    async def watch_loop():
+        last_mtime = mtime()
+        while True:
+            await asyncio.sleep(interval)
+            current_mtime = mtime()
+            if current_mtime is None or current_mtime == last_mtime:
+                continue
+            last_mtime = current_mtime
+            try:
+                mapping = {
+                    CollectionName(key): name for key, name in load_collection_mapping_file().items()
+                    if key in CollectionName.__members__
+                }
+                await switch_collections(mapping)
+            except Exception as e:
+                logger.error(f"Failed to switch collections from {path}: {e}")
+
+    app.state.collection_mapping_task = asyncio.create_task(watch_loop())
+
 async def fetch_drug_url(package_insert_no: str) -> Optional[str]:
     """package_insert_noからURLを取得する（旧バージョン・互換性のため残す）"""
     try:
@@ -149,18 +1274,73 @@ async def fetch_drug_url(package_insert_no: str) -> Optional[str]:
         api_base_url = os.getenv("DRUG_API_BASE_URL", "https://oma7a27ol6.execute-api.ap-northeast-1.amazonaws.com/Prod/")
         url = f"{api_base_url}api/v1/code-to-url/{drug_code}"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, timeout=10.0)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("url")
-            else:
-                logger.warning(f"Failed to fetch URL for drug_code {drug_code}: status {response.status_code}")
-                return None
+        client = get_http_client()
+        response = await client.get(url, timeout=10.0)
+        if response.status_code == 200:
+            data = response.json()
+            return data.get("url")
+        else:
+            logger.warning(f"Failed to fetch URL for drug_code {drug_code}: status {response.status_code}")
+            return None
     except Exception as e:
         logger.error(f"Error fetching drug URL for {package_insert_no}: {e}")
         return None
 
+class CircuitBreaker:
+    """外部API呼び出し用のサーキットブレーカー
+
+    連続失敗が failure_threshold に達するとopenになり、recovery_timeout の間は呼び出しを行わない。
+    その後half-openとなり、1件のみ試行（プローブ）を許可して成功すればclosedに戻す。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.recovery_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info("Circuit breaker closed")
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            if self._opened_at is None or self._probing:
+                logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures")
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+drug_api_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("DRUG_API_BREAKER_THRESHOLD", "5")),
+    recovery_timeout=float(os.getenv("DRUG_API_BREAKER_RECOVERY", "30")),
+)
+
 async def fetch_drug_url_by_yj_code(yj_code: str) -> Optional[List[str]]:
     """YJコード（医薬品コード）から全てのドキュメントURLを取得する
 
@@ -177,40 +1357,166 @@ async def fetch_drug_url_by_yj_code(yj_code: str) -> Optional[List[str]]:
             logger.warning(f"Invalid yj_code: {yj_code}")
             return []
 
+        # サーキットブレーカーがopenの場合は呼び出さない（payloadのurlにフォールバックする）
+        if not drug_api_breaker.allow():
+            return []
+
         # 環境変数からAPIベースURLを取得
         api_base_url = os.getenv("DRUG_API_BASE_URL", "https://oma7a27ol6.execute-api.ap-northeast-1.amazonaws.com/Prod/")
         url = f"{api_base_url}api/v1/documents/by-code/{yj_code}"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, timeout=10.0)
-            if response.status_code == 200:
-                data = response.json()
-                document_links = data.get("document_links", {})
-                html_links = document_links.get("html", [])
+        client = get_http_client()
+        try:
+            response = await client.get(url, timeout=float(os.getenv("DRUG_API_TIMEOUT", "10")))
+        except Exception:
+            drug_api_breaker.record_failure()
+            raise
 
-                # HTML URLを全て取得
-                urls = [link.get("url") for link in html_links if link.get("url")]
+        # 5xxは障害として、それ以外（404等）は正常応答として扱う
+        if response.status_code >= 500:
+            drug_api_breaker.record_failure()
+        else:
+            drug_api_breaker.record_success()
 
-                if urls:
-                    return urls
+        if response.status_code == 200:
+            data = response.json()
+            document_links = data.get("document_links", {})
+            html_links = document_links.get("html", [])
 
-                # HTMLがない場合はPDFのURLを取得
-                pdf_links = document_links.get("pdf", [])
-                urls = [link.get("url") for link in pdf_links if link.get("url")]
+            # HTML URLを全て取得
+            urls = [link.get("url") for link in html_links if link.get("url")]
 
-                return urls if urls else []
-            else:
-                logger.warning(f"Failed to fetch URL for yj_code {yj_code}: status {response.status_code}")
-                return []
+            if urls:
+                return urls
+
+            # HTMLがない場合はPDFのURLを取得
+            pdf_links = document_links.get("pdf", [])
+            urls = [link.get("url") for link in pdf_links if link.get("url")]
+
+            return urls if urls else []
+        else:
+            logger.warning(f"Failed to fetch URL for yj_code {yj_code}: status {response.status_code}")
+            return []
     except Exception as e:
         logger.error(f"Error fetching drug URL for yj_code {yj_code}: {e}")
         return []
 
-def transform_cubec_note_response(points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def split_yj_codes(yj_codes_str: str) -> List[str]:
+    """カンマ区切りのYJコード文字列を分割する"""
+    if not yj_codes_str:
+        return []
+    return [code.strip() for code in yj_codes_str.split(',') if code.strip()]
+
+def get_yj_codes(metadata: Dict[str, Any]) -> List[str]:
+    """ポイントのYJコード一覧を取得する（正規化済みの yj_codes があればそれを使用）"""
+    yj_codes = metadata.get("yj_codes")
+    if isinstance(yj_codes, list):
+        return yj_codes
+    return split_yj_codes(metadata.get("yj_code", ""))
+
+# 実行中のURL取得タスク（YJコード → タスク）。同じYJコードの取得は1つのタスクにまとめる
+_inflight_url_fetches: Dict[str, asyncio.Task] = {}
+
+async def fetch_and_cache_drug_urls(yj_code: str) -> List[str]:
+    """YJコードのURLを取得し、取得できた場合はURLキャッシュに格納する"""
+    urls = await fetch_drug_url_by_yj_code(yj_code)
+    if urls:
+        await cache_io(drug_url_cache, drug_url_cache.set, yj_code, urls)
+    return urls
+
+def start_drug_url_fetch(yj_code: str) -> asyncio.Task:
+    """YJコードのURL取得タスクを開始する（実行中のタスクがあればそれを返す）"""
+    task = _inflight_url_fetches.get(yj_code)
+    if task is None:
+        task = asyncio.ensure_future(fetch_and_cache_drug_urls(yj_code))
+        _inflight_url_fetches[yj_code] = task
+        task.add_done_callback(lambda _: _inflight_url_fetches.pop(yj_code, None))
+    return task
+
+async def fetch_urls_for_codes(yj_codes: List[str]) -> Dict[str, List[str]]:
+    """YJコードに対応するURLをURLキャッシュ経由で並行取得し、YJコードをキーとした辞書で返す
+
+    URL取得はリクエストごとの期限（DRUG_URL_DEADLINE秒）内に完了したものだけを使用する。
+    期限を過ぎたYJコードは結果に含めず（payloadのurlにフォールバック）、取得処理はバックグラウンドで
+    継続して完了後にURLキャッシュへ格納する。
+    """
+    unique_codes = list(dict.fromkeys(yj_codes))
+    for yj_code in unique_codes:
+        access_recorder.record("yj_code", yj_code)
+    url_cache = await cache_io(drug_url_cache, drug_url_cache.get_many, unique_codes)
+    missing = [yj_code for yj_code in unique_codes if yj_code not in url_cache]
+
+    if missing:
+        # 並行して未キャッシュのyj_codeに対してのみURL取得を実行
+        tasks = {start_drug_url_fetch(yj_code): yj_code for yj_code in missing}
+        # URL取得の期限はリクエストの残り時間を超えない
+        deadline = float(os.getenv("DRUG_URL_DEADLINE", "2"))
+        remaining = remaining_time()
+        if remaining is not None:
+            deadline = max(0.0, min(deadline, remaining))
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+
+        # 取得できた結果を格納（URLリストとして）。取得失敗（空リスト）は使用しない
+        for task in done:
+            if not task.cancelled() and task.exception() is None and task.result():
+                url_cache[tasks[task]] = task.result()
+
+        # URLを取得できなかったYJコードはpayloadのurlにフォールバックするため、ETagを付与しない
+        if any(yj_code not in url_cache for yj_code in missing):
+            mark_uncacheable()
+
+        # 未完了のタスクはバックグラウンドで継続し、完了後にURLキャッシュへ格納される
+        if pending:
+            logger.warning(f"Drug URL enrichment deadline exceeded for {len(pending)} yj_codes, falling back to payload url")
+
+    return url_cache
+
+async def fetch_url_cache(points: List[PointRecord]) -> Dict[str, List[str]]:
+    """ポイントのYJコードに対応するURLを並行取得し、YJコードをキーとした辞書で返す"""
+    # 各ポイントのyj_codeを収集（カンマ区切りは分割済み）
+    all_yj_codes = []
+    for point in points:
+        metadata = point.payload.get("metadata", {})
+        all_yj_codes.extend(get_yj_codes(metadata))
+    return await fetch_urls_for_codes(all_yj_codes)
+
+# URL取得トークン → [{"id": ポイントID, "yj_codes": [...], "fallback_url": ...}]
+# 別のワーカーが発行したトークンも参照できるよう、複数ワーカーではCACHE_BACKENDにsqliteまたはredisを使用する
+url_token_store = create_cache("url_token", ttl=float(os.getenv("URL_TOKEN_TTL", "600")), max_entries=10000)
+
+async def enrich_package_insert_urls(points: List[PointRecord], mode: EnrichUrlsMode) -> tuple:
+    """enrich_urlsモードに応じてURLを取得する
+
+    Returns:
+        (変換に渡すurl_cache, deferredの場合のトークン)
+    """
+    if mode == EnrichUrlsMode.SYNC:
+        return await fetch_url_cache(points), None
+    if mode == EnrichUrlsMode.OFF or not points:
+        return {}, None
+
+    # deferred: 未キャッシュのYJコードの取得をバックグラウンドで開始し、結果はURLキャッシュに格納する
+    entries = []
+    for point in points:
+        payload = point.payload
+        entries.append({"id": point.id, "yj_codes": get_yj_codes(payload.get("metadata", {})), "fallback_url": payload.get("url")})
+    yj_codes = list(dict.fromkeys(yj_code for entry in entries for yj_code in entry["yj_codes"]))
+    cached = await cache_io(drug_url_cache, drug_url_cache.get_many, yj_codes)
+    for yj_code in yj_codes:
+        access_recorder.record("yj_code", yj_code)
+        if yj_code not in cached:
+            start_drug_url_fetch(yj_code)
+
+    token = uuid.uuid4().hex
+    await cache_io(url_token_store, url_token_store.set, token, entries)
+    mark_uncacheable()
+    return {}, token
+
+def transform_cubec_note_response(points: List[PointRecord]) -> List[Dict[str, Any]]:
     """CUBEC_NOTEのレスポンスを元の形式に変換する"""
     transformed = []
     for point in points:
-        payload = point.get("payload", {})
+        payload = point.payload
         metadata = payload.get("metadata", {})
 
         # metadataをフラット化し、フィールド名を元の名前にマッピング
@@ -296,23 +1602,23 @@ def transform_cubec_note_response(points: List[Dict[str, Any]]) -> List[Dict[str
             new_payload["gl"] = gl_array
 
         transformed_point = {
-            "id": point.get("id"),
+            "id": point.id,
             "payload": new_payload
         }
 
         # vectorがあれば追加
-        if "vector" in point:
-            transformed_point["vector"] = point["vector"]
+        if point.vector is not None:
+            transformed_point["vector"] = point.vector
 
         transformed.append(transformed_point)
 
     return transformed
 
-def transform_gl_response(points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def transform_gl_response(points: List[PointRecord]) -> List[Dict[str, Any]]:
     """GLのレスポンスを整形する"""
     transformed = []
     for point in points:
-        payload = point.get("payload", {})
+        payload = point.payload
         metadata = payload.get("metadata", {})
 
         # metadataをフラット化
@@ -358,19 +1664,59 @@ def transform_gl_response(points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             new_payload["bibliographic_information"] = ""
 
         transformed_point = {
-            "id": point.get("id"),
+            "id": point.id,
             "payload": new_payload
         }
 
         # vectorがあれば追加
-        if "vector" in point:
-            transformed_point["vector"] = point["vector"]
+        if point.vector is not None:
+            transformed_point["vector"] = point.vector
 
         transformed.append(transformed_point)
 
     return transformed
 
-def transform_package_insert_response(points: List[Dict[str, Any]], url_cache: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+def resolve_point_urls(yj_codes: List[str], fallback_url: Optional[str], url_cache: Optional[Dict[str, List[str]]]) -> tuple:
+    """ポイントのURLリストとpackage_insert_noを決定する
+
+    Args:
+        yj_codes: ポイントの全YJコード
+        fallback_url: payloadのurl（url_cacheにURLがない場合に使用）
+        url_cache: YJコードをキーとしたURLリストの辞書
+
+    Returns:
+        (重複を除いたURLリスト, package_insert_no)
+    """
+    urls = []
+
+    # url_cacheがある場合、カンマ区切りの全YJコードからURLを収集
+    if url_cache:
+        for yj_code in yj_codes:
+            if yj_code in url_cache:
+                urls.extend(url_cache[yj_code])
+
+    # url_cacheがない場合は、payloadのurlを使用（後方互換性）
+    if not urls and fallback_url:
+        urls = [fallback_url]
+
+    # 重複を削除しつつ順序を保持
+    unique_urls = list(dict.fromkeys(urls))
+
+    # URLからpackage_insert_noを抽出（最初のURLから）
+    package_insert_no = None
+    if urls:
+        first_url = urls[0]
+        try:
+            last_part = first_url.rstrip('/').split('/')[-1]
+            # 最初のアンダースコアの後の部分を取得
+            if '_' in last_part:
+                package_insert_no = '_'.join(last_part.split('_')[1:])
+        except Exception as e:
+            logger.warning(f"Failed to extract package_insert_no from URL {first_url}: {e}")
+
+    return unique_urls, package_insert_no
+
+def transform_package_insert_response(points: List[PointRecord], url_cache: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
     """PACKAGE_INSERTのレスポンスを旧API互換形式に変換する
 
     Args:
@@ -379,7 +1725,7 @@ def transform_package_insert_response(points: List[Dict[str, Any]], url_cache: O
     """
     transformed = []
     for point in points:
-        payload = point.get("payload", {})
+        payload = point.payload
         metadata = payload.get("metadata", {})
 
         # metadataをフラット化して旧API形式にマッピング
@@ -393,58 +1739,10 @@ def transform_package_insert_response(points: List[Dict[str, Any]], url_cache: O
             "source": metadata.get("source", ""),
         }
 
-        # URLを配列として設定
-        urls = []
-
-        # url_cacheがある場合、カンマ区切りの全YJコードからURLを収集
-        if url_cache:
-            yj_codes_str = metadata.get("yj_code", "")
-            if yj_codes_str:
-                # カンマ区切りのYJコードを分割
-                yj_codes = [code.strip() for code in yj_codes_str.split(',') if code.strip()]
-
-                # 全てのYJコードのURLを収集
-                for yj_code in yj_codes:
-                    if yj_code in url_cache:
-                        urls.extend(url_cache[yj_code])
-
-        # url_cacheがない場合は、payloadのurlを使用（後方互換性）
-        if not urls:
-            url = payload.get("url")
-            if url:
-                urls = [url]
-
-        # 重複を削除しつつ順序を保持
-        seen = set()
-        unique_urls = []
-        for url in urls:
-            if url not in seen:
-                seen.add(url)
-                unique_urls.append(url)
-
-        # URLを配列として設定（複数URL対応）
-        new_payload["url"] = unique_urls
-
-        # URLからpackage_insert_noを抽出（最初のURLから）
-        if urls:
-            first_url = urls[0]
-            try:
-                path_parts = first_url.rstrip('/').split('/')
-                if path_parts:
-                    last_part = path_parts[-1]
-                    # 最初のアンダースコアの後の部分を取得
-                    if '_' in last_part:
-                        package_insert_no = '_'.join(last_part.split('_')[1:])
-                        new_payload["package_insert_no"] = package_insert_no
-                    else:
-                        new_payload["package_insert_no"] = None
-                else:
-                    new_payload["package_insert_no"] = None
-            except Exception as e:
-                logger.warning(f"Failed to extract package_insert_no from URL {first_url}: {e}")
-                new_payload["package_insert_no"] = None
-        else:
-            new_payload["package_insert_no"] = None
+        # URLを配列として設定（複数URL対応）し、最初のURLからpackage_insert_noを抽出
+        new_payload["url"], new_payload["package_insert_no"] = resolve_point_urls(
+            get_yj_codes(metadata), payload.get("url"), url_cache
+        )
 
         # 旧APIには存在したが新コレクションにはないフィールド（互換性のためnullで設定）
         new_payload["product_number"] = None
@@ -466,124 +1764,796 @@ def transform_package_insert_response(points: List[Dict[str, Any]], url_cache: O
         new_payload["common_name"] = metadata.get("common_name", "")
 
         transformed_point = {
-            "id": point.get("id"),
+            "id": point.id,
             "payload": new_payload
         }
 
         # vectorがあれば追加
-        if "vector" in point:
-            transformed_point["vector"] = point["vector"]
+        if point.vector is not None:
+            transformed_point["vector"] = point.vector
 
         transformed.append(transformed_point)
 
     return transformed
 
-def search_points_by_filters(collection_name: str, filters: List[Dict[str, Any]], with_payload: bool = True, with_vectors: bool = False):
-    """フィルター条件に基づいてポイントを検索する"""
+def compact_contexts(points: List[Dict[str, Any]]) -> Dict[str, str]:
+    """変換済みポイントのcontextを重複排除する（compactモード用）
+
+    同一成分の後発品などで同じ本文が繰り返されるため、contextをハッシュをキーとした
+    テーブルに1回だけ格納し、各ポイントには参照（context_ref）のみを残す。
+
+    Args:
+        points: 変換済みのポイントリスト（payload.contextを置き換える）
+
+    Returns:
+        ハッシュをキーとしたcontextの辞書
+    """
+    contexts: Dict[str, str] = {}
+    refs: Dict[str, str] = {}
+    for point in points:
+        payload = point.get("payload")
+        if not payload or "context" not in payload:
+            continue
+        context = payload.pop("context")
+        ref = refs.get(context)
+        if ref is None:
+            ref = hashlib.blake2b(context.encode("utf-8"), digest_size=8).hexdigest()
+            refs[context] = ref
+            contexts[ref] = context
+        payload["context_ref"] = ref
+    return contexts
+
+def _extract_vector(vector: Any) -> Optional[List[float]]:
+    """Qdrantのvector（単一またはnamed vector）から再ランキング用のベクトルを取り出す"""
+    if vector is None:
+        return None
+    if isinstance(vector, dict):
+        vector_name = os.getenv("RERANK_VECTOR_NAME")
+        if vector_name:
+            return vector.get(vector_name)
+        # 名前指定がない場合は最初のdenseベクトルを使用
+        for value in vector.values():
+            if isinstance(value, list):
+                return value
+        return None
+    return vector
+
+def rerank_points(
+    points: List[PointRecord],
+    mode: RerankMode,
+    top_k: Optional[int] = None,
+    lambda_mult: float = 0.5,
+    threshold: float = 0.95,
+    query_vector: Optional[List[float]] = None,
+) -> List[PointRecord]:
+    """保存済みベクトルを用いてポイントを再ランキングする（MMR / 類似度しきい値による重複除去）
+
+    Args:
+        points: vectorを含むポイントのリスト（関連度の高い順に並んでいる前提）
+        mode: 再ランキング方式
+        top_k: 返却する最大件数
+        lambda_mult: MMRの関連度の重み
+        threshold: dedupで同一とみなすコサイン類似度
+        query_vector: 関連度計算に用いるクエリベクトル
+
+    Returns:
+        再ランキング後のポイントリスト（ベクトルを持たないポイントは末尾に元の順序で付加）
+
+    Raises:
+        ValueError: ベクトルの次元が一致しない場合
+    """
+    import numpy as np
+
+    with_vec = []
+    without_vec = []
+    for point in points:
+        vector = _extract_vector(point.vector)
+        if vector:
+            with_vec.append((point, vector))
+        else:
+            without_vec.append(point)
+
+    n = len(with_vec)
+    if n == 0:
+        return points[:top_k] if top_k else points
+
+    dim = len(with_vec[0][1])
+    if any(len(vector) != dim for _, vector in with_vec):
+        raise ValueError("Stored vectors have different dimensions")
+    if query_vector and len(query_vector) != dim:
+        raise ValueError(f"query_vector has {len(query_vector)} dimensions, but stored vectors have {dim}")
+
+    # 正規化してコサイン類似度行列を一括計算
+    matrix = np.asarray([vector for _, vector in with_vec], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+    similarity = matrix @ matrix.T
+
+    selected: List[int] = []
+    if mode == RerankMode.DEDUP:
+        # 取得順に走査し、既に採用したポイントとの最大類似度がしきい値未満のものだけ残す
+        max_sim = np.full(n, -np.inf, dtype=np.float32)
+        for i in range(n):
+            if max_sim[i] >= threshold:
+                continue
+            selected.append(i)
+            if top_k and len(selected) >= top_k:
+                break
+            np.maximum(max_sim, similarity[i], out=max_sim)
+    else:
+        if query_vector:
+            query = np.asarray(query_vector, dtype=np.float32)
+            query_norm = np.linalg.norm(query)
+            relevance = matrix @ (query / query_norm if query_norm else query)
+        else:
+            # クエリベクトルがない場合は取得順を関連度とみなす
+            relevance = 1.0 - np.arange(n, dtype=np.float32) / n
+
+        k = min(top_k, n) if top_k else n
+        max_sim = np.zeros(n, dtype=np.float32)
+        available = np.ones(n, dtype=bool)
+        for _ in range(k):
+            scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim
+            scores[~available] = -np.inf
+            idx = int(np.argmax(scores))
+            selected.append(idx)
+            available[idx] = False
+            np.maximum(max_sim, similarity[idx], out=max_sim)
+
+    result = [with_vec[i][0] for i in selected]
+    remaining = (top_k - len(result)) if top_k else len(without_vec)
+    if remaining > 0:
+        result.extend(without_vec[:remaining])
+    return result
+
+def apply_rerank(points: List[PointRecord], options: RerankOptions, with_vectors: bool) -> List[PointRecord]:
+    """リクエストの再ランキングオプションを適用し、要求されていないベクトルを除去する"""
+    if not options.rerank:
+        return points
+
     try:
-        client = QdrantClient(
-            url=os.getenv("QDRANT_URL"),
-            api_key=os.getenv("QDRANT_API_KEY"),
-            timeout=60,
+        points = rerank_points(
+            points,
+            mode=options.rerank,
+            top_k=options.rerank_top_k,
+            lambda_mult=options.rerank_lambda if options.rerank_lambda is not None else 0.5,
+            threshold=options.rerank_threshold if options.rerank_threshold is not None else 0.95,
+            query_vector=options.query_vector,
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 再ランキングのために内部取得したベクトルは返却しない
+    if not with_vectors:
+        for point in points:
+            point.vector = None
+
+    return points
+
+# 正規化済みYJコード配列のインデックス有無（コレクション名 → (有無, 確認時刻)）
+_yj_codes_index_cache: Dict[str, tuple] = {}
+YJ_CODES_INDEX_CHECK_INTERVAL = 300
+
+def has_yj_codes_index(collection_name: str) -> bool:
+    """コレクションに metadata.yj_codes のkeywordインデックスが存在するか確認する（結果は一定時間キャッシュ）"""
+    cached = _yj_codes_index_cache.get(collection_name)
+    if cached and time.monotonic() - cached[1] < YJ_CODES_INDEX_CHECK_INTERVAL:
+        return cached[0]
 
-        # フィルター条件を構築
-        conditions = []
-        for filter_item in filters:
-            field = filter_item.get("field")
-            value = filter_item.get("value")
-            field_type = filter_item.get("type", "keyword")  # デフォルトはkeyword
-
-            if field and value is not None:
-                if field_type == "text":
-                    # text型インデックスの場合
-                    conditions.append(
-                        FieldCondition(
-                            key=field,
-                            match=MatchText(text=value)
-                        )
+    try:
+        payload_schema = get_qdrant_client(collection_name).get_collection(collection_name).payload_schema or {}
+        index_info = payload_schema.get("metadata.yj_codes")
+        available = index_info is not None and index_info.data_type == "keyword"
+    except Exception as e:
+        logger.warning(f"Failed to inspect payload schema of {collection_name}: {e}")
+        available = False
+
+    _yj_codes_index_cache[collection_name] = (available, time.monotonic())
+    return available
+
+def yj_code_filter(collection_name: str, yj_code: str) -> Dict[str, Any]:
+    """YJコード検索用のフィルター条件を作成する
+
+    移行済み（metadata.yj_codes が存在する）コレクションではMatchAnyによる完全一致、
+    未移行のコレクションでは従来通り metadata.yj_code へのテキスト検索を使用する
+    """
+    if has_yj_codes_index(collection_name):
+        return {"field": "metadata.yj_codes", "value": split_yj_codes(yj_code), "type": "any"}
+    return {"field": "metadata.yj_code", "value": yj_code, "type": "text"}
+
+def build_filter(filters: List[Dict[str, Any]]):
+    """フィルター条件（field / value / type の辞書リスト）からQdrantのFilterを構築する"""
+    from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MatchText, MatchAny
+
+    conditions = []
+    for filter_item in filters:
+        field = filter_item.get("field")
+        value = filter_item.get("value")
+        field_type = filter_item.get("type", "keyword")  # デフォルトはkeyword
+
+        if field and value is not None:
+            if field_type == "any":
+                # keyword配列に対する完全一致（いずれかに一致）
+                conditions.append(
+                    FieldCondition(
+                        key=field,
+                        match=MatchAny(any=value)
                     )
-                else:
-                    # keyword型インデックスの場合
-                    conditions.append(
-                        FieldCondition(
-                            key=field,
-                            match=MatchValue(value=value)
-                        )
+                )
+            elif field_type == "text":
+                # text型インデックスの場合
+                conditions.append(
+                    FieldCondition(
+                        key=field,
+                        match=MatchText(text=value)
+                    )
+                )
+            else:
+                # keyword型インデックスの場合
+                conditions.append(
+                    FieldCondition(
+                        key=field,
+                        match=MatchValue(value=value)
                     )
+                )
 
-        if not conditions:
-            raise ValueError("No valid filter conditions provided")
+    if not conditions:
+        raise ValueError("No valid filter conditions provided")
+
+    return Filter(must=conditions)
+
+def search_points_by_filters(collection_name: str, filters: List[Dict[str, Any]], with_payload: bool = True, with_vectors: bool = False):
+    """フィルター条件に基づいてポイントを検索する"""
+    timeout = qdrant_timeout()
+    try:
+        client = get_qdrant_client(collection_name)
 
         # 検索を実行
-        search_filter = Filter(must=conditions)
+        search_filter = build_filter(filters)
 
         points = client.scroll(
             collection_name=collection_name,
             scroll_filter=search_filter,
             with_payload=with_payload,
             with_vectors=with_vectors,
-            limit=10000  # 最大10000件まで取得
+            limit=10000,  # 最大10000件まで取得
+            timeout=timeout
         )[0]  # scroll returns tuple (points, next_page_offset)
 
-        result = []
+        return [PointRecord.from_qdrant(point, with_vectors) for point in points]
+
+    except qdrant_response_error() as e:
+        logger.error(f"Qdrant API error: {e}")
+        raise HTTPException(status_code=400, detail=f"Qdrant API error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Unexpected error in search_points_by_filters: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+class FacetCache:
+    """ファセット集計結果のキャッシュ
+
+    TTLを過ぎたエントリは古い値をそのまま返しつつ、バックグラウンドで再集計する。
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._refresh_tasks: Dict[Any, asyncio.Task] = {}
+
+    async def get(self, key: Any, loader: Callable[[], Any]) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            value = await asyncio.to_thread(loader)
+            self._set(key, value)
+            return value
+
+        value, loaded_at = entry
+        self._entries.move_to_end(key)
+        if time.monotonic() - loaded_at >= self.ttl and key not in self._refresh_tasks:
+            self._refresh_tasks[key] = asyncio.create_task(self._refresh(key, loader))
+        return value
+
+    async def _refresh(self, key: Any, loader: Callable[[], Any]):
+        try:
+            self._set(key, await asyncio.to_thread(loader))
+        except Exception as e:
+            logger.warning(f"Failed to refresh facet cache for {key}: {e}")
+        finally:
+            self._refresh_tasks.pop(key, None)
+
+    def _set(self, key: Any, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def invalidate(self, match: Callable[[Any], bool]):
+        for key in [key for key in self._entries if match(key)]:
+            del self._entries[key]
+
+facet_cache = FacetCache(ttl=float(os.getenv("FACET_CACHE_TTL", "3600")))
+
+def load_cubec_note_facets(collection_name: str) -> Dict[str, Dict[str, int]]:
+    """CUBEC_NOTEを疾患名・タイトルのみ射影してscrollし、疾患ごとのタイトル件数を集計する
+
+    Returns:
+        {疾患名: {タイトル: チャンク数}}
+    """
+    client = get_qdrant_client(collection_name)
+    facets: Dict[str, Dict[str, int]] = {}
+    offset = None
+
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            offset=offset,
+            with_payload=["metadata.disease_name", "metadata.main_category"],
+            with_vectors=False,
+        )
         for point in points:
-            point_dict = {
-                "id": point.id,
-                "payload": point.payload if point.payload else {},
-            }
-            if with_vectors and point.vector:
-                point_dict["vector"] = point.vector
-            result.append(point_dict)
+            metadata = (point.payload or {}).get("metadata", {})
+            disease = metadata.get("disease_name")
+            if not disease:
+                continue
+            titles = facets.setdefault(disease, {})
+            title = metadata.get("main_category")
+            if title:
+                titles[title] = titles.get(title, 0) + 1
+            else:
+                titles.setdefault("", 0)
+        if offset is None:
+            break
+
+    return facets
+
+def load_section_facets(collection_name: str, yj_code: str) -> List[Dict[str, Any]]:
+    """PACKAGE_INSERTの医薬品（YJコード）ごとのセクションタイトル件数を集計する
+
+    section_titleはkeywordインデックスのためQdrantのファセットAPIを使用し、
+    利用できない場合はセクションタイトルのみ射影したscrollで集計する
+    """
+    client = get_qdrant_client(collection_name)
+    facet_filter = build_filter([yj_code_filter(collection_name, yj_code)])
+
+    try:
+        response = client.facet(
+            collection_name=collection_name,
+            key="metadata.section_title",
+            facet_filter=facet_filter,
+            limit=int(os.getenv("FACET_LIMIT", "1000")),
+            exact=True,
+        )
+        return [{"value": hit.value, "count": hit.count} for hit in response.hits]
+    except Exception as e:
+        logger.info(f"Facet API unavailable for {collection_name}, falling back to scroll: {e}")
+
+    counts: Dict[str, int] = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=facet_filter,
+            limit=1000,
+            offset=offset,
+            with_payload=["metadata.section_title"],
+            with_vectors=False,
+        )
+        for point in points:
+            section_title = (point.payload or {}).get("metadata", {}).get("section_title")
+            if section_title:
+                counts[section_title] = counts.get(section_title, 0) + 1
+        if offset is None:
+            break
 
-        return result
+    return [{"value": value, "count": count} for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
 
-    except ResponseHandlingException as e:
+async def get_cubec_note_facets() -> Dict[str, Dict[str, int]]:
+    """CUBEC_NOTEのファセット集計（キャッシュ経由）"""
+    collection_name = CollectionName.CUBEC_NOTE.get_actual_name()
+    try:
+        return await facet_cache.get(("cubec_note", collection_name), lambda: load_cubec_note_facets(collection_name))
+    except qdrant_response_error() as e:
         logger.error(f"Qdrant API error: {e}")
         raise HTTPException(status_code=400, detail=f"Qdrant API error: {str(e)}")
     except Exception as e:
-        logger.error(f"Unexpected error in search_points_by_filters: {e}")
+        logger.error(f"Unexpected error in get_cubec_note_facets: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-class CubecNoteChapterRequest(BaseModel):
+def normalize_for_autocomplete(text: str) -> str:
+    """オートコンプリート用に文字列を正規化する
+
+    - NFKCで全角英数・半角カナなどの表記揺れを統一
+    - 大文字・小文字を同一視
+    - カタカナをひらがなに変換
+    - 空白を除去
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    chars = []
+    for ch in text:
+        code = ord(ch)
+        if 0x30A1 <= code <= 0x30F6:
+            # カタカナ → ひらがな
+            chars.append(chr(code - 0x60))
+        elif not ch.isspace():
+            chars.append(ch)
+    return "".join(chars)
+
+class PrefixIndex:
+    """正規化済みキーのソート済み配列に対する二分探索による前方一致インデックス"""
+
+    def __init__(self, entries: List[tuple]):
+        # entries: (正規化キー, 表示値, フィールド名)
+        self._entries = sorted(set(entries))
+        self._keys = [entry[0] for entry in self._entries]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def search(self, prefix: str, limit: int) -> List[tuple]:
+        start = bisect.bisect_left(self._keys, prefix)
+        end = bisect.bisect_left(self._keys, prefix + "\U0010ffff", lo=start)
+        return self._entries[start:min(end, start + limit)]
+
+# オートコンプリート対象（コレクション → 対象フィールド）
+AUTOCOMPLETE_FIELDS: Dict[CollectionName, List[str]] = {
+    CollectionName.CUBEC_NOTE: ["disease_name"],
+    CollectionName.PACKAGE_INSERT: ["product_name", "generic_name", "common_name"],
+}
+
+class AutocompleteIndex:
+    """疾患名・医薬品名のオートコンプリート用インデックス
+
+    コレクションごとにPrefixIndexを保持し、コレクション（実コレクション名・ポイント数）が
+    変化したコレクションのみを再構築して差し替える。
+    """
+
+    def __init__(self):
+        self._indexes: Dict[CollectionName, PrefixIndex] = {}
+        self._versions: Dict[CollectionName, tuple] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return len(self._indexes) == len(AUTOCOMPLETE_FIELDS)
+
+    @staticmethod
+    def _collection_version(collection: CollectionName) -> tuple:
+        collection_name = collection.get_actual_name()
+        info = get_qdrant_client(collection_name).get_collection(collection_name)
+        return (collection_name, info.points_count)
+
+    @staticmethod
+    def _load(collection: CollectionName) -> PrefixIndex:
+        collection_name = collection.get_actual_name()
+        fields = AUTOCOMPLETE_FIELDS[collection]
+        client = get_qdrant_client(collection_name)
+        entries = set()
+        offset = None
+
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=1000,
+                offset=offset,
+                with_payload=[f"metadata.{field}" for field in fields],
+                with_vectors=False,
+            )
+            for point in points:
+                metadata = (point.payload or {}).get("metadata", {})
+                for field in fields:
+                    value = metadata.get(field)
+                    if isinstance(value, str) and value.strip():
+                        entries.add((normalize_for_autocomplete(value), value.strip(), field))
+            if offset is None:
+                break
+
+        return PrefixIndex(list(entries))
+
+    async def refresh(self):
+        """変化のあったコレクションのインデックスのみ再構築する"""
+        async with self._lock:
+            for collection in AUTOCOMPLETE_FIELDS:
+                try:
+                    version = await asyncio.to_thread(self._collection_version, collection)
+                    if self._versions.get(collection) == version and collection in self._indexes:
+                        continue
+                    index = await asyncio.to_thread(self._load, collection)
+                    self._indexes[collection] = index
+                    self._versions[collection] = version
+                    logger.info(f"Built autocomplete index for {version[0]}: {len(index)} entries")
+                except Exception as e:
+                    logger.warning(f"Failed to build autocomplete index for {collection.value}: {e}")
+
+    def search(self, query: str, limit: int = 10, collection: Optional[CollectionName] = None) -> List[Dict[str, Any]]:
+        prefix = normalize_for_autocomplete(query)
+        if not prefix:
+            return []
+
+        matches = []
+        for key, index in self._indexes.items():
+            if collection and key != collection:
+                continue
+            matches.extend((entry, key) for entry in index.search(prefix, limit))
+
+        # 完全一致・短い候補を優先
+        matches.sort(key=lambda match: (len(match[0][0]), match[0][0]))
+        return [
+            {"value": entry[1], "field": entry[2], "collection": key.value}
+            for entry, key in matches[:limit]
+        ]
+
+autocomplete_index = AutocompleteIndex()
+
+# page_contentの全文検索に対応するコレクション（page_contentのtextインデックスを前提とする）
+TEXT_SEARCH_COLLECTIONS = [
+    collection for collection, required in REQUIRED_PAYLOAD_INDEXES.items() if "page_content" in required
+]
+
+def normalize_with_offsets(text: str) -> tuple:
+    """検索語と同じ正規化（NFKC + 小文字化）を行い、正規化後の各文字に対応する元の文字列の範囲を返す
+
+    Returns:
+        (正規化後の文字列, 各文字の元の開始位置のリスト, 各文字の元の終了位置のリスト)
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text) and unicodedata.is_normalized("NFKC", lowered):
+        positions = list(range(len(text)))
+        return lowered, positions, [position + 1 for position in positions]
+
+    # 半角カナの濁点など、後続の結合文字とまとめて正規化する単位に分ける
+    clusters: List[List[int]] = []
+    for index, char in enumerate(text):
+        normalized = unicodedata.normalize("NFKC", char)
+        if clusters and normalized and unicodedata.combining(normalized[0]):
+            clusters[-1][1] = index + 1
+        else:
+            clusters.append([index, index + 1])
+
+    parts = []
+    starts: List[int] = []
+    ends: List[int] = []
+    for start, end in clusters:
+        normalized = unicodedata.normalize("NFKC", text[start:end]).lower()
+        parts.append(normalized)
+        starts.extend([start] * len(normalized))
+        ends.extend([end] * len(normalized))
+    return "".join(parts), starts, ends
+
+def build_snippet(text: str, terms: List[str], length: int = 120) -> Dict[str, Any]:
+    """本文から検索語を最も多く含む範囲を切り出し、スニペットと強調箇所（スニペット内の[開始, 終了)）を返す
+
+    検索語と同じくNFKCで正規化した本文で検索し、強調箇所は元の本文の位置に戻して返す
+    """
+    normalized, starts, ends = normalize_with_offsets(text)
+    spans = []
+    for term in terms:
+        if not term:
+            continue
+        start = normalized.find(term)
+        while start != -1 and len(spans) < 100:
+            spans.append((starts[start], ends[start + len(term) - 1]))
+            start = normalized.find(term, start + len(term))
+
+    # 重なった強調箇所をまとめる
+    merged: List[List[int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    # 強調箇所を最も多く含む範囲を選ぶ（各強調箇所の少し手前から始まる範囲を候補とする）
+    window_start = 0
+    best = 0
+    for start, _ in merged[:50]:
+        candidate = max(0, min(start - length // 4, len(text) - length))
+        covered = sum(1 for s, e in merged if s >= candidate and e <= candidate + length)
+        if covered > best:
+            window_start, best = candidate, covered
+    window_end = min(len(text), window_start + length)
+
+    prefix = "…" if window_start > 0 else ""
+    suffix = "…" if window_end < len(text) else ""
+    highlights = [
+        [s - window_start + len(prefix), e - window_start + len(prefix)]
+        for s, e in merged
+        if s >= window_start and e <= window_end
+    ]
+    return {"snippet": prefix + text[window_start:window_end] + suffix, "highlights": highlights}
+
+def search_page_content(collection_name: str, query: str, section_title: Optional[str], limit: int, offset: Optional[int]) -> tuple:
+    """page_contentの全文検索（textインデックス）で1ページ分のポイントを取得する
+
+    Returns:
+        (ポイントリスト, 次ページのoffset。最終ページの場合はNone)
+    """
+    timeout = qdrant_timeout()
+    try:
+        filters = [{"field": "page_content", "value": query, "type": "text"}]
+        if section_title:
+            filters.append({"field": "metadata.section_title", "value": section_title, "type": "keyword"})
+
+        points, next_offset = get_qdrant_client(collection_name).scroll(
+            collection_name=collection_name,
+            scroll_filter=build_filter(filters),
+            with_payload=True,
+            with_vectors=False,
+            limit=limit,
+            offset=offset,
+            timeout=timeout
+        )
+        return [PointRecord.from_qdrant(point) for point in points], next_offset
+
+    except qdrant_response_error() as e:
+        logger.error(f"Qdrant API error: {e}")
+        raise HTTPException(status_code=400, detail=f"Qdrant API error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Unexpected error in search_page_content: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+class CubecNoteChapterRequest(RerankOptions):
     title: str
     disease: str
     with_payload: Optional[bool] = True
     with_vectors: Optional[bool] = False
 
-class CubecNotePageRequest(BaseModel):
+class CubecNotePageRequest(RerankOptions):
     disease: str
     with_payload: Optional[bool] = True
     with_vectors: Optional[bool] = False
 
-class PackageInsertChapterRequest(BaseModel):
+class PackageInsertChapterRequest(RerankOptions):
     yj_code: str
     section_title: str
     with_payload: Optional[bool] = True
     with_vectors: Optional[bool] = False
+    enrich_urls: EnrichUrlsMode = EnrichUrlsMode.SYNC
+    compact: Optional[bool] = False
+
+class PackageInsertUrlsRequest(BaseModel):
+    token: Optional[str] = None
+    yj_codes: Optional[List[str]] = None
 
 class PackageInsertCoreSectionsRequest(BaseModel):
     yj_code: str
 
+class CubecNoteChapterKey(BaseModel):
+    title: str
+    disease: str
+
+class CubecNoteChaptersRequest(BaseModel):
+    chapters: List[CubecNoteChapterKey]
+
+class TextSearchRequest(BaseModel):
+    q: str
+    collection_name: CollectionName = CollectionName.CUBEC_NOTE
+    section_title: Optional[str] = None
+    limit: int = 20
+    offset: Optional[int] = None
+    snippet_length: int = 120
+
+def cubec_note_chapter_filters(title: str, disease: str) -> List[Dict[str, Any]]:
+    """CUBEC_NOTEの章（タイトル・疾患名）のフィルター条件"""
+    return [
+        {"field": "metadata.main_category", "value": title, "type": "text"},
+        {"field": "metadata.disease_name", "value": disease, "type": "text"}
+    ]
+
+def get_cubec_note_chapters_cached(chapters: List[tuple]) -> List[List[Dict[str, Any]]]:
+    """複数のCUBEC_NOTEの章を取得して変換する
+
+    レスポンスキャッシュ（章取得APIと共有）にない章のみを、Qdrantのバッチクエリ1回でまとめて取得する。
+
+    Returns:
+        chaptersと同じ順序の、章ごとの変換済みポイントリスト
+    """
+    collection_name = CollectionName.CUBEC_NOTE.get_actual_name()
+    results: Dict[tuple, List[Dict[str, Any]]] = {}
+    missing = []
+    for title, disease in dict.fromkeys(chapters):
+        transformed_points = response_cache.get(("cubec_note_chapter", collection_name, title, disease))
+        if transformed_points is None:
+            missing.append((title, disease))
+        else:
+            results[(title, disease)] = transformed_points
+
+    if missing:
+        timeout = qdrant_timeout()
+        try:
+            from qdrant_client.http.models import QueryRequest
+
+            responses = get_qdrant_client(collection_name).query_batch_points(
+                collection_name=collection_name,
+                requests=[
+                    QueryRequest(filter=build_filter(cubec_note_chapter_filters(title, disease)), limit=10000, with_payload=True)
+                    for title, disease in missing
+                ],
+                timeout=timeout
+            )
+        except qdrant_response_error() as e:
+            logger.error(f"Qdrant API error: {e}")
+            raise HTTPException(status_code=400, detail=f"Qdrant API error: {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected error in get_cubec_note_chapters_cached: {e}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+        for (title, disease), response in zip(missing, responses):
+            points = [PointRecord.from_qdrant(point) for point in response.points]
+            transformed_points = transform_cubec_note_response(points)
+            response_cache.set(("cubec_note_chapter", collection_name, title, disease), transformed_points)
+            results[(title, disease)] = transformed_points
+
+    return [results[chapter] for chapter in chapters]
+
+def get_cubec_note_chapter_cached(title: str, disease: str, collection_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """CUBEC_NOTEの章を取得して変換する（デフォルトオプションの結果をキャッシュ）
+
+    collection_nameを指定した場合はそのコレクションから取得する（切り替え前のウォームアップ用）
+    """
+    collection_name = collection_name or CollectionName.CUBEC_NOTE.get_actual_name()
+    cache_key = ("cubec_note_chapter", collection_name, title, disease)
+    transformed_points = response_cache.get(cache_key)
+    if transformed_points is None:
+        points = search_points_by_filters(collection_name=collection_name, filters=cubec_note_chapter_filters(title, disease))
+        transformed_points = transform_cubec_note_response(points)
+        response_cache.set(cache_key, transformed_points)
+    return transformed_points
+
 @app.post("/api/cubec-note/chapter")
 async def get_cubec_note_chapter(request: CubecNoteChapterRequest):
     """CUBEC_NOTEの章取得API - titleとdiseaseで検索"""
-    filters = [
-        {"field": "metadata.main_category", "value": request.title, "type": "text"},
-        {"field": "metadata.disease_name", "value": request.disease, "type": "text"}
-    ]
+    access_recorder.record("chapter", (request.title, request.disease))
+
+    if request.with_payload and not request.with_vectors and not request.rerank:
+        transformed_points = await run_with_deadline(get_cubec_note_chapter_cached, request.title, request.disease)
+        return json_response({"success": True, "data": transformed_points, "count": len(transformed_points)})
+
+    filters = cubec_note_chapter_filters(request.title, request.disease)
 
-    points = search_points_by_filters(
+    points = await run_with_deadline(
+        search_points_by_filters,
         collection_name=CollectionName.CUBEC_NOTE.get_actual_name(),
         filters=filters,
         with_payload=request.with_payload,
-        with_vectors=request.with_vectors
+        with_vectors=request.with_vectors or bool(request.rerank)
     )
+    points = apply_rerank(points, request, request.with_vectors)
 
     # レスポンスを元の形式に変換
     transformed_points = transform_cubec_note_response(points)
 
-    return {"success": True, "data": transformed_points, "count": len(transformed_points)}
+    return json_response({"success": True, "data": transformed_points, "count": len(transformed_points)})
+
+@app.get("/api/cubec-note/chapter")
+async def get_cubec_note_chapter_by_query(request: Annotated[CubecNoteChapterRequest, Query()]):
+    """CUBEC_NOTEの章取得API（GET版） - CDN・リバースプロキシでキャッシュ可能"""
+    return await get_cubec_note_chapter(request)
+
+@app.post("/api/cubec-note/chapters")
+async def get_cubec_note_chapters(request: CubecNoteChaptersRequest):
+    """CUBEC_NOTEの複数章取得API - (title, disease)の組のリストを1回のバッチクエリで取得"""
+    if not request.chapters:
+        raise HTTPException(status_code=400, detail="chapters cannot be empty")
+    max_chapters = int(os.getenv("MAX_BATCH_CHAPTERS", "50"))
+    if len(request.chapters) > max_chapters:
+        raise HTTPException(status_code=400, detail=f"Too many chapters (max {max_chapters})")
+
+    chapters = [(chapter.title, chapter.disease) for chapter in request.chapters]
+    for chapter in chapters:
+        access_recorder.record("chapter", chapter)
+
+    results = await run_with_deadline(get_cubec_note_chapters_cached, chapters)
+    data = [
+        {"title": title, "disease": disease, "data": transformed_points, "count": len(transformed_points)}
+        for (title, disease), transformed_points in zip(chapters, results)
+    ]
+    return json_response({"success": True, "data": data, "count": len(data)})
 
 @app.post("/api/cubec-note/page")
 async def get_cubec_note_page(request: CubecNotePageRequest):
@@ -592,60 +2562,88 @@ async def get_cubec_note_page(request: CubecNotePageRequest):
         {"field": "metadata.disease_name", "value": request.disease, "type": "text"}
     ]
 
-    points = search_points_by_filters(
+    points = await run_with_deadline(
+        search_points_by_filters,
         collection_name=CollectionName.CUBEC_NOTE.get_actual_name(),
         filters=filters,
         with_payload=request.with_payload,
-        with_vectors=request.with_vectors
+        with_vectors=request.with_vectors or bool(request.rerank)
     )
+    points = apply_rerank(points, request, request.with_vectors)
 
     # レスポンスを元の形式に変換
     transformed_points = transform_cubec_note_response(points)
 
-    return {"success": True, "data": transformed_points, "count": len(transformed_points)}
+    return json_response({"success": True, "data": transformed_points, "count": len(transformed_points)})
+
+@app.get("/api/cubec-note/page")
+async def get_cubec_note_page_by_query(request: Annotated[CubecNotePageRequest, Query()]):
+    """CUBEC_NOTEのページ取得API（GET版） - CDN・リバースプロキシでキャッシュ可能"""
+    return await get_cubec_note_page(request)
 
 @app.post("/api/package-insert/chapter")
 async def get_package_insert_chapter(request: PackageInsertChapterRequest):
     """PACKAGE_INSERTの章取得API - yj_codeとsection_titleで検索"""
+    collection_name = CollectionName.PACKAGE_INSERT.get_actual_name()
+    # インデックスの確認（キャッシュ切れの場合はget_collection）をイベントループ外で期限内に行う
     filters = [
-        {"field": "metadata.yj_code", "value": request.yj_code, "type": "text"},
+        await run_with_deadline(yj_code_filter, collection_name, request.yj_code),
         {"field": "metadata.section_title", "value": request.section_title, "type": "keyword"}
     ]
 
-    points = search_points_by_filters(
-        collection_name=CollectionName.PACKAGE_INSERT.get_actual_name(),
+    points = await run_with_deadline(
+        search_points_by_filters,
+        collection_name=collection_name,
         filters=filters,
         with_payload=request.with_payload,
-        with_vectors=request.with_vectors
+        with_vectors=request.with_vectors or bool(request.rerank)
     )
+    points = apply_rerank(points, request, request.with_vectors)
 
-    # URLを取得して追加
-    url_cache = {}
-    if points:
-        # 各ポイントのyj_codeを収集し、カンマ区切りを分割
-        all_yj_codes = set()
-        for point in points:
-            metadata = point.get("payload", {}).get("metadata", {})
-            yj_codes_str = metadata.get("yj_code", "")
-            if yj_codes_str:
-                # カンマ区切りのYJコードを分割して全て収集
-                codes = [code.strip() for code in yj_codes_str.split(',') if code.strip()]
-                all_yj_codes.update(codes)
-
-        if all_yj_codes:
-            # 並行してユニークなyj_codeに対してのみURL取得を実行
-            tasks = [fetch_drug_url_by_yj_code(yj_code) for yj_code in all_yj_codes]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # 結果をキャッシュに格納（URLリストとして）
-            for yj_code, result in zip(all_yj_codes, results):
-                if not isinstance(result, Exception) and result:
-                    url_cache[yj_code] = result
+    # URLを取得して追加（enrich_urlsモードに応じて）
+    url_cache, url_token = await enrich_package_insert_urls(points, request.enrich_urls)
 
     # レスポンスを旧API互換形式に変換（url_cacheを渡す）
     transformed_points = transform_package_insert_response(points, url_cache)
 
-    return {"success": True, "data": transformed_points, "count": len(transformed_points)}
+    response = {"success": True, "data": transformed_points, "count": len(transformed_points)}
+    if request.compact:
+        response["contexts"] = compact_contexts(transformed_points)
+    if url_token:
+        response["url_token"] = url_token
+    return json_response(response)
+
+@app.get("/api/package-insert/chapter")
+async def get_package_insert_chapter_by_query(request: Annotated[PackageInsertChapterRequest, Query()]):
+    """PACKAGE_INSERTの章取得API（GET版） - CDN・リバースプロキシでキャッシュ可能"""
+    return await get_package_insert_chapter(request)
+
+@app.post("/api/package-insert/urls")
+async def get_package_insert_urls(request: PackageInsertUrlsRequest):
+    """PACKAGE_INSERTのURLを一括取得するAPI
+
+    enrich_urls: "deferred" で返されたトークン（ポイントIDごとのURL）またはYJコードのリストを指定する。
+    URLキャッシュにないYJコードのみ医薬品URL取得APIを呼び出す。
+    """
+    if request.token:
+        entries = await cache_io(url_token_store, url_token_store.get, request.token)
+        if entries is None:
+            raise HTTPException(status_code=404, detail="URL token not found or expired")
+
+        url_cache = await fetch_urls_for_codes([yj_code for entry in entries for yj_code in entry["yj_codes"]])
+        data = []
+        for entry in entries:
+            urls, package_insert_no = resolve_point_urls(entry["yj_codes"], entry.get("fallback_url"), url_cache)
+            data.append({"id": entry["id"], "url": urls, "package_insert_no": package_insert_no})
+        return {"success": True, "data": data, "count": len(data)}
+
+    if request.yj_codes:
+        yj_codes = [yj_code for value in request.yj_codes for yj_code in split_yj_codes(value)]
+        url_cache = await fetch_urls_for_codes(yj_codes)
+        data = [{"yj_code": yj_code, "url": url_cache.get(yj_code, [])} for yj_code in dict.fromkeys(yj_codes)]
+        return {"success": True, "data": data, "count": len(data)}
+
+    raise HTTPException(status_code=400, detail="token or yj_codes is required")
 
 @app.post("/api/package-insert/core-sections")
 async def get_package_insert_core_sections(request: PackageInsertCoreSectionsRequest):
@@ -667,17 +2665,29 @@ async def get_package_insert_core_sections(request: PackageInsertCoreSectionsReq
         "adverse_reactions": ""
     }
 
+    collection_name = CollectionName.PACKAGE_INSERT.get_actual_name()
+    yj_filter = await run_with_deadline(yj_code_filter, collection_name, request.yj_code)
+
+    # 期限切れで検索できなかったセクションがある場合はpartialとして返す
+    partial = False
+
     # 各セクションを検索
     for key, section_titles in section_mappings.items():
         for section_title in section_titles:
             filters = [
-                {"field": "metadata.yj_code", "value": request.yj_code, "type": "text"},
+                yj_filter,
                 {"field": "metadata.section_title", "value": section_title, "type": "keyword"}
             ]
 
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                partial = True
+                break
+
             try:
-                points = search_points_by_filters(
-                    collection_name=CollectionName.PACKAGE_INSERT.get_actual_name(),
+                points = await run_with_deadline(
+                    search_points_by_filters,
+                    collection_name=collection_name,
                     filters=filters,
                     with_payload=True,
                     with_vectors=False
@@ -685,35 +2695,152 @@ async def get_package_insert_core_sections(request: PackageInsertCoreSectionsReq
 
                 # 最初の1件が見つかればそのpage_contentを使用
                 if points and len(points) > 0:
-                    page_content = points[0].get("payload", {}).get("page_content", "")
+                    page_content = points[0].payload.get("page_content", "")
                     # メタデータを除外
                     cleaned_content = remove_metadata_from_section(page_content)
                     sections_data[key] = cleaned_content
                     break  # 見つかったら次のセクションへ
 
+            except HTTPException as e:
+                if e.status_code != 504:
+                    logger.warning(f"Error searching for section {section_title}: {e.detail}")
+                    continue
+                partial = True
+                break
             except Exception as e:
                 logger.warning(f"Error searching for section {section_title}: {e}")
                 continue
 
-    return {
+    response = {
         "success": True,
         "data": {
             "yj_code": request.yj_code,
             "payload": sections_data
         }
     }
+    if partial:
+        response["partial"] = True
+        mark_uncacheable()
+    return response
+
+@app.get("/api/package-insert/core-sections")
+async def get_package_insert_core_sections_by_query(request: Annotated[PackageInsertCoreSectionsRequest, Query()]):
+    """PACKAGE_INSERTの主要セクション取得API（GET版） - CDN・リバースプロキシでキャッシュ可能"""
+    return await get_package_insert_core_sections(request)
+
+@app.get("/api/cubec-note/facets/diseases")
+async def get_cubec_note_disease_facets():
+    """CUBEC_NOTEの疾患名一覧（チャンク数付き）"""
+    facets = await get_cubec_note_facets()
+    data = [{"value": disease, "count": sum(titles.values())} for disease, titles in sorted(facets.items())]
+    return {"success": True, "data": data, "count": len(data)}
+
+@app.get("/api/cubec-note/facets/titles")
+async def get_cubec_note_title_facets(disease: str):
+    """CUBEC_NOTEの疾患ごとのタイトル一覧（チャンク数付き）"""
+    facets = await get_cubec_note_facets()
+    titles = facets.get(disease, {})
+    data = [{"value": title, "count": count} for title, count in sorted(titles.items()) if title]
+    return {"success": True, "disease": disease, "data": data, "count": len(data)}
+
+@app.get("/api/package-insert/facets/sections")
+async def get_package_insert_section_facets(yj_code: str):
+    """PACKAGE_INSERTの医薬品ごとのセクションタイトル一覧（チャンク数付き）"""
+    collection_name = CollectionName.PACKAGE_INSERT.get_actual_name()
+    try:
+        data = await facet_cache.get(
+            ("sections", collection_name, yj_code),
+            lambda: load_section_facets(collection_name, yj_code),
+        )
+    except qdrant_response_error() as e:
+        logger.error(f"Qdrant API error: {e}")
+        raise HTTPException(status_code=400, detail=f"Qdrant API error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Unexpected error in get_package_insert_section_facets: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    return {"success": True, "yj_code": yj_code, "data": data, "count": len(data)}
+
+@app.get("/api/autocomplete")
+async def autocomplete(q: str, limit: int = 10, collection: Optional[CollectionName] = None):
+    """疾患名・医薬品名（販売名・一般名・一般的名称）のオートコンプリート
+
+    構築済みのインデックスのみで検索する（未構築のコレクションはバックグラウンドの更新処理で再構築する）。
+    """
+    if not autocomplete_index.ready:
+        # 構築途中の結果にETagを付けてキャッシュさせない
+        mark_uncacheable()
+    data = autocomplete_index.search(q, limit=max(1, min(limit, 100)), collection=collection)
+    return {"success": True, "query": q, "data": data, "count": len(data)}
+
+@app.post("/api/search")
+async def search_text(request: TextSearchRequest):
+    """page_contentの全文検索API - 本文全体ではなく検索語を含むスニペットを返す"""
+    if request.collection_name not in TEXT_SEARCH_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Text search is not supported for {request.collection_name.value}")
+    query = unicodedata.normalize("NFKC", request.q).strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="q cannot be empty")
+
+    points, next_offset = await run_with_deadline(
+        search_page_content,
+        request.collection_name.get_actual_name(),
+        query,
+        request.section_title,
+        max(1, min(request.limit, 100)),
+        request.offset,
+    )
+
+    # 本文の代わりにスニペットを返す（PACKAGE_INSERTのURLはpayloadのurlを使用し、URL取得APIは呼ばない）
+    if request.collection_name == CollectionName.CUBEC_NOTE:
+        transformed_points = transform_cubec_note_response(points)
+    else:
+        transformed_points = transform_package_insert_response(points)
+    terms = [term.lower() for term in query.split()]
+    snippet_length = max(20, min(request.snippet_length, 1000))
+    for point in transformed_points:
+        point.update(build_snippet(point["payload"].pop("context", ""), terms, snippet_length))
+
+    return json_response({
+        "success": True,
+        "query": request.q,
+        "data": transformed_points,
+        "count": len(transformed_points),
+        "next_offset": next_offset,
+    })
+
+@app.get("/api/search")
+async def search_text_by_query(request: Annotated[TextSearchRequest, Query()]):
+    """page_contentの全文検索API（GET版）"""
+    return await search_text(request)
 
 @app.post("/api")
 async def get_points(request: PointRequest):
     if not request.point_ids:
         raise HTTPException(status_code=400, detail="point_ids cannot be empty")
 
-    points = get_points_from_ids(
-        point_ids=request.point_ids,
-        collection_name=request.collection_name.get_actual_name(),
-        with_payload=request.with_payload,
-        with_vectors=request.with_vectors
-    )
+    for point_id in request.point_ids:
+        access_recorder.record("point", (request.collection_name.value, point_id))
+
+    if request.with_payload and not request.with_vectors and not request.rerank:
+        points = await run_with_deadline(get_points_cached, request.point_ids, request.collection_name.get_actual_name())
+    else:
+        points = await run_with_deadline(
+            get_points_from_ids,
+            point_ids=request.point_ids,
+            collection_name=request.collection_name.get_actual_name(),
+            with_payload=request.with_payload,
+            with_vectors=request.with_vectors or bool(request.rerank)
+        )
+
+    # 存在しなかったIDはreport_missingの場合のみレスポンスに含める
+    missing_ids = None
+    if request.report_missing:
+        returned_ids = {point.id for point in points}
+        missing_ids = [point_id for point_id in dict.fromkeys(request.point_ids) if point_id not in returned_ids]
+
+    if request.rerank:
+        # ポイントはリクエスト順（上流の検索順位）で返るため、そのまま再ランキングする
+        points = apply_rerank(points, request, request.with_vectors)
 
     # CUBEC_NOTEコレクションの場合、レスポンスを変換
     if request.collection_name == CollectionName.CUBEC_NOTE:
@@ -724,42 +2851,477 @@ async def get_points(request: PointRequest):
         points = transform_gl_response(points)
 
     # PACKAGE_INSERTコレクションの場合、URLを取得して追加し、レスポンスを変換
+    url_token = None
     if request.collection_name == CollectionName.PACKAGE_INSERT:
-        # 各ポイントのyj_codeを収集し、カンマ区切りを分割
-        all_yj_codes = set()
-        for point in points:
-            metadata = point.get("payload", {}).get("metadata", {})
-            yj_codes_str = metadata.get("yj_code", "")
-            if yj_codes_str:
-                # カンマ区切りのYJコードを分割して全て収集
-                codes = [code.strip() for code in yj_codes_str.split(',') if code.strip()]
-                all_yj_codes.update(codes)
-
-        url_cache = {}
-        if all_yj_codes:
-            # 並行してユニークなyj_codeに対してのみURL取得を実行
-            tasks = [fetch_drug_url_by_yj_code(yj_code) for yj_code in all_yj_codes]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # 結果をキャッシュに格納（URLリストとして）
-            for yj_code, result in zip(all_yj_codes, results):
-                if not isinstance(result, Exception) and result:
-                    url_cache[yj_code] = result
+        url_cache, url_token = await enrich_package_insert_urls(points, request.enrich_urls)
 
         # レスポンスを旧API互換形式に変換（url_cacheを渡す）
         points = transform_package_insert_response(points, url_cache)
 
-    return {"success": True, "data": points, "count": len(points)}
+    response = {"success": True, "data": points, "count": len(points)}
+    if request.compact:
+        response["contexts"] = compact_contexts(points)
+    if missing_ids is not None:
+        response["missing_ids"] = missing_ids
+    if url_token:
+        response["url_token"] = url_token
+    return json_response(response)
+
+# 条件付きリクエスト（ETag / If-None-Match）の対象とする読み取り系エンドポイント
+ETAG_ROUTES = {
+    "/api",
+    "/api/cubec-note/chapter",
+    "/api/cubec-note/chapters",
+    "/api/cubec-note/page",
+    "/api/package-insert/chapter",
+    "/api/package-insert/core-sections",
+    "/api/cubec-note/facets/diseases",
+    "/api/cubec-note/facets/titles",
+    "/api/package-insert/facets/sections",
+    "/api/autocomplete",
+    "/api/search",
+}
+
+# GETレスポンスのCache-Control。If-None-Matchによる再検証（304）でコレクションの変更を検出する
+# ブラウザは毎回再検証し（max-age=0）、CDNは短時間（s-maxage）だけ再検証せずに返す。
+# コレクションを切り替えるとETagが変わるため、古い内容が返るのは最大でs-maxage + stale-while-revalidate秒
+CACHE_CONTROL = (
+    f"public, max-age=0, s-maxage={int(os.getenv('CACHE_CONTROL_S_MAXAGE', '60'))}, "
+    f"stale-while-revalidate={int(os.getenv('CACHE_CONTROL_STALE_WHILE_REVALIDATE', '30'))}"
+)
+
+def compute_etag(method: str, path: str, query: str, body: bytes) -> str:
+    """解決済みのコレクション名とリクエストパラメータから強いETagを計算する
+
+    コレクションは日付付きで作成され更新されないため、コレクション名が変わらない限り
+    同じリクエストには同じレスポンスを返す。レスポンス形式を変更した場合はETAG_VERSIONを変更する。
+    """
+    # JSONボディはキーの順序・空白に依存しないよう正規化する
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8") if body else b""
+    except ValueError:
+        pass
+    query = "&".join(sorted(query.split("&"))) if query else ""
+
+    digest = hashlib.sha256()
+    for part in (
+        os.getenv("ETAG_VERSION", ""),
+        ",".join(collection.get_actual_name() for collection in CollectionName),
+        method,
+        path,
+        query,
+    ):
+        digest.update(part.encode("utf-8") + b"\0")
+    digest.update(body)
+    return f'"{digest.hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Matchヘッダーが指定のETagに一致するか（弱い比較）"""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def add_cache_headers(response: Response):
+    """GETをCDN・リバースプロキシでキャッシュできるよう、Cache-Controlを付与する
+
+    VaryはCORSMiddlewareが付与するOriginなどを上書きしないよう追記する。
+    """
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.headers.add_vary_header("Accept-Encoding")
+
+@app.middleware("http")
+async def conditional_requests(request: Request, call_next):
+    """読み取り系エンドポイントにETagを付与し、If-None-Matchが一致する場合はQdrantを呼ばずに304を返す"""
+    if request.method not in ("GET", "POST") or request.url.path not in ETAG_ROUTES:
+        return await call_next(request)
+
+    etag = compute_etag(request.method, request.url.path, request.url.query, await request.body())
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        response = Response(status_code=304, headers={"ETag": etag})
+        if request.method == "GET":
+            add_cache_headers(response)
+        return response
+
+    flags = {"cacheable": True}
+    token = response_flags.set(flags)
+    try:
+        response = await call_next(request)
+    finally:
+        response_flags.reset(token)
+
+    if response.status_code == 200 and flags["cacheable"]:
+        response.headers["ETag"] = etag
+        if request.method == "GET":
+            add_cache_headers(response)
+    elif request.method == "GET":
+        response.headers["Cache-Control"] = "no-store"
+    return response
+
+def _parse_route_timeouts(value: str) -> Dict[str, float]:
+    """ROUTE_TIMEOUTS（"パス=秒,パス=秒"）を解析する"""
+    timeouts = {}
+    for item in value.split(","):
+        if "=" in item:
+            path, seconds = item.rsplit("=", 1)
+            timeouts[path.strip()] = float(seconds)
+    return timeouts
+
+ROUTE_TIMEOUTS = _parse_route_timeouts(os.getenv("ROUTE_TIMEOUTS", ""))
+
+def _ewma(average: float, value: float) -> float:
+    return value if average == 0 else 0.8 * average + 0.2 * value
+
+class AdmissionLimiter:
+    """同時実行数の上限と上限付きの待ち行列による流入制御
+
+    上限に達している場合は待ち行列で待機し、優先リクエストは通常のリクエストより先に実行枠を得る。
+    処理時間の移動平均から待ち時間を見積もる（実行枠が空くまでの時間は全体の平均、
+    リクエスト自体の処理時間はルートごとの平均を使用する）。
+    """
+
+    def __init__(self, limit: int, queue_size: int):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.service_time = 0.0  # 処理時間の指数移動平均（秒）
+        self.route_service_times: Dict[str, float] = {}  # ルートごとの処理時間の指数移動平均（秒）
+        self._waiters = {True: deque(), False: deque()}  # 優先 / 通常
+
+    def would_queue(self) -> bool:
+        """今から実行枠を確保する場合に待ち行列に入るか"""
+        return self.active >= self.limit or bool(self._waiters[True]) or bool(self._waiters[False])
+
+    def estimated_wait(self, priority: bool = False) -> float:
+        """今から待ち行列に入った場合の待ち時間の見積もり（秒）"""
+        if self.active < self.limit:
+            return 0.0
+        ahead = len(self._waiters[True]) + (0 if priority else len(self._waiters[False]))
+        return math.ceil((ahead + 1) / self.limit) * self.service_time
+
+    async def acquire(self, priority: bool, timeout: float) -> bool:
+        """実行枠を確保する。待ち行列が満杯の場合・timeout秒以内に確保できない場合はFalse"""
+        if self.active < self.limit and not self._waiters[True] and not self._waiters[False]:
+            self.active += 1
+            return True
+        waiters = self._waiters[priority]
+        if len(self._waiters[True]) + len(self._waiters[False]) >= self.queue_size:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter in waiters:
+                waiters.remove(waiter)
+            return False
+        except asyncio.CancelledError:
+            # 実行枠を引き渡された直後にキャンセルされた場合は、次のリクエストに引き渡す
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            elif waiter in waiters:
+                waiters.remove(waiter)
+            raise
+
+    def release(self, elapsed: Optional[float] = None, route: Optional[str] = None):
+        """実行枠を解放する（待っているリクエストがあれば優先リクエストから順に引き渡す）"""
+        if elapsed is not None:
+            self.service_time = _ewma(self.service_time, elapsed)
+            if route is not None:
+                self.route_service_times[route] = _ewma(self.route_service_times.get(route, 0.0), elapsed)
+        for waiters in (self._waiters[True], self._waiters[False]):
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+
+# 流入制御の対象外（プローブ・ドキュメント）
+ADMISSION_EXEMPT_ROUTES = {"/healthz", "/readyz", "/docs", "/openapi.json"}
+# 軽いルートは全体の待ち行列で重いルートより先に実行枠を得る
+ADMISSION_PRIORITY_ROUTES = {
+    path.strip() for path in os.getenv(
+        "ADMISSION_PRIORITY_ROUTES",
+        "/collections,/api/package-insert/core-sections,/api/cubec-note/facets/diseases,"
+        "/api/cubec-note/facets/titles,/api/package-insert/facets/sections,/api/autocomplete",
+    ).split(",") if path.strip()
+}
+admission_limiter = AdmissionLimiter(
+    limit=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32")),
+    queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "100")),
+)
+# ルートごとの同時実行数の上限（重いscrollを行うルートを制限する）
+route_limiters = {
+    path: AdmissionLimiter(limit=max(1, int(limit)), queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "100")))
+    for path, limit in _parse_route_timeouts(os.getenv("ROUTE_CONCURRENCY", "/api/cubec-note/page=4")).items()
+}
+
+def overloaded(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is overloaded"},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """同時実行数を制限し、期限までに処理を開始できないリクエストは早めに503（Retry-After付き）で拒否する"""
+    path = request.url.path
+    if request.method == "OPTIONS" or path in ADMISSION_EXEMPT_ROUTES:
+        return await call_next(request)
+
+    priority = path in ADMISSION_PRIORITY_ROUTES
+    # 処理時間はアプリケーションのルートのみ記録する（存在しないパスでルートごとの記録が増え続けないように）
+    route = path if any(getattr(app_route, "path", None) == path for app_route in app.router.routes) else None
+    limiters = [limiter for limiter in (route_limiters.get(path), admission_limiter) if limiter is not None]
+
+    acquired = []
+    try:
+        for limiter in limiters:
+            # 待ち行列に入る場合、期限（X-Request-Timeout・ROUTE_TIMEOUTS）までに処理を終えられない見込みなら待たずに拒否する
+            estimated_wait = limiter.estimated_wait(priority)
+            remaining = remaining_time()
+            if (
+                remaining is not None
+                and limiter.would_queue()
+                and estimated_wait + limiter.route_service_times.get(path, 0.0) > remaining
+            ):
+                return overloaded(estimated_wait)
+
+            timeout = remaining if remaining is not None else float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+            if not await limiter.acquire(priority, timeout=max(0.0, timeout)):
+                return overloaded(limiter.estimated_wait(priority) or limiter.service_time)
+            acquired.append((limiter, time.monotonic()))
+
+        return await call_next(request)
+    finally:
+        for limiter, started_at in reversed(acquired):
+            limiter.release(time.monotonic() - started_at, route)
+
+@app.middleware("http")
+async def apply_request_deadline(request: Request, call_next):
+    """リクエストの期限を設定する
+
+    クライアントが指定したX-Request-Timeout（秒）とルートごとのROUTE_TIMEOUTSのうち短い方を期限とし、
+    QdrantのタイムアウトとURL取得の期限に残り時間を引き継ぐ。
+    """
+    timeouts = []
+    header = request.headers.get("x-request-timeout")
+    if header:
+        try:
+            timeout = float(header)
+        except ValueError:
+            timeout = None
+        # inf / nan / 0以下は期限として扱えないため不正な値とする
+        if timeout is None or not (math.isfinite(timeout) and timeout > 0):
+            return JSONResponse(status_code=400, content={"detail": "Invalid X-Request-Timeout header"})
+        timeouts.append(timeout)
+    if request.url.path in ROUTE_TIMEOUTS:
+        timeouts.append(ROUTE_TIMEOUTS[request.url.path])
+
+    if not timeouts:
+        return await call_next(request)
+
+    token = request_deadline.set(time.monotonic() + min(timeouts))
+    try:
+        return await call_next(request)
+    finally:
+        request_deadline.reset(token)
+
+# ログに出力しないヘッダー（認証用の秘密情報）
+REDACTED_HEADERS = {"x-admin-token", "x-profile"}
 
 @app.middleware("http")
 async def debug_requests(request: Request, call_next):
     logger.info(f"Method: {request.method}, URL: {request.url}")
-    logger.info(f"Headers: {dict(request.headers)}")
+    headers = {name: "[REDACTED]" if name in REDACTED_HEADERS else value for name, value in request.headers.items()}
+    logger.info(f"Headers: {headers}")
     
     response = await call_next(request)
     logger.info(f"Response status: {response.status_code}")
     return response
 
+class StackSampler:
+    """全スレッドのスタックを一定間隔でサンプリングし、折り畳み形式（flamegraph.pl / speedscope用）で集計する
+
+    Qdrantの呼び出しはスレッドプールで実行されるため、イベントループのスレッドだけでなく全スレッドを対象にする。
+    他のリクエストの処理もサンプルに含まれる。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                # サンプラー自身と、仕事待ちのスレッドプールのワーカーは除外する
+                if thread_id == own_id or (
+                    frame.f_code.co_name == "_worker" and frame.f_code.co_filename.endswith(os.path.join("concurrent", "futures", "thread.py"))
+                ):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+# プロファイル結果（プロファイルID → 折り畳み形式のスタックと計測情報）
+profile_store = create_cache("profile", ttl=float(os.getenv("PROFILE_TTL", "3600")), max_entries=100)
+
+def sign_profile_request(token: str, path: str, expires_at: int) -> str:
+    return hmac.new(token.encode("utf-8"), f"{expires_at}:{path}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+def profile_authorized(request: Request, token: str) -> bool:
+    """X-Admin-Token、または /admin/profile-tokens で発行した署名付きのX-Profileヘッダーを確認する"""
+    if hmac.compare_digest(request.headers.get("x-admin-token", ""), token):
+        return True
+    expires, _, signature = request.headers.get("x-profile", "").partition(".")
+    try:
+        expires_at = int(expires)
+    except ValueError:
+        return False
+    if expires_at < time.time():
+        return False
+    return hmac.compare_digest(signature, sign_profile_request(token, request.url.path, expires_at))
+
+def profile_headers(profile: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "Content-Disposition": f'attachment; filename="profile-{profile["id"]}.folded"',
+        "X-Profile-Status": str(profile["status"]),
+        "X-Profile-Duration-Ms": f"{profile['duration_ms']:.1f}",
+        "X-Profile-Samples": str(profile["samples"]),
+    }
+
+class ProfilingMiddleware:
+    """X-Profileヘッダー付きのリクエストをサンプリングプロファイラで計測する
+
+    X-Profile-Mode: attachment の場合はレスポンスの代わりにプロファイルを返し、
+    それ以外の場合はプロファイルを保存してX-Profile-IDヘッダーを付与する（/admin/profiles/{id}で取得）。
+    ヘッダーのないリクエストはそのまま通す（ASGIミドルウェアとして実装し、ヘッダーの確認以外の処理を行わない）。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(name == b"x-profile" for name, _ in scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        # ADMIN_TOKENが未設定の場合はプロファイリングを無効にする
+        token = os.getenv("ADMIN_TOKEN")
+        if not token:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        if not profile_authorized(request, token):
+            await JSONResponse(status_code=403, content={"detail": "Forbidden"})(scope, receive, send)
+            return
+
+        attachment = request.headers.get("x-profile-mode", "").lower() == "attachment"
+        profile_id = uuid.uuid4().hex
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if attachment:
+                    return
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode("ascii"))]
+            elif attachment:
+                return
+            await send(message)
+
+        sampler = StackSampler(float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005")))
+        started_at = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+            profile = {
+                "id": profile_id,
+                "method": request.method,
+                "path": request.url.path,
+                "status": status_code,
+                "duration_ms": (time.perf_counter() - started_at) * 1000,
+                "samples": sampler.samples,
+                "stacks": sampler.folded(),
+            }
+            logger.info(
+                f"Profiled {profile['method']} {profile['path']}: id={profile_id} status={status_code} "
+                f"duration={profile['duration_ms']:.0f}ms samples={sampler.samples}"
+            )
+            if not attachment:
+                await cache_io(profile_store, profile_store.set, profile_id, profile)
+
+        if attachment:
+            response = Response(content=profile["stacks"], media_type="text/plain; charset=utf-8", headers=profile_headers(profile))
+            await response(scope, receive, send)
+
+app.add_middleware(ProfilingMiddleware)
+
+class ProfileTokenRequest(BaseModel):
+    path: str
+    ttl: int = 600
+
+@app.post("/admin/profile-tokens")
+async def create_profile_token(body: ProfileTokenRequest, request: Request):
+    """指定したパスのリクエストをプロファイリングするための、期限付きの署名付きX-Profileヘッダーを発行する（X-Admin-Tokenが必要）"""
+    require_admin(request)
+    expires_at = int(time.time()) + max(1, min(body.ttl, 3600))
+    value = f"{expires_at}.{sign_profile_request(os.getenv('ADMIN_TOKEN'), body.path, expires_at)}"
+    return {"success": True, "data": {"path": body.path, "expires_at": expires_at, "header": "X-Profile", "value": value}}
+
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, request: Request):
+    """保存したプロファイルを折り畳み形式のテキストとして取得する（X-Admin-Tokenが必要）"""
+    require_admin(request)
+    profile = await cache_io(profile_store, profile_store.get, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found or expired")
+    return Response(content=profile["stacks"], media_type="text/plain; charset=utf-8", headers=profile_headers(profile))
+
+# CORS設定（他のミドルウェアより後に登録して最も外側で実行し、流入制御の503や304などにもCORSヘッダーを付与する）
+cors_origins_str = os.environ.get("CORS_ORIGINS", "*")
+cors_origins = cors_origins_str.split(",") if cors_origins_str != "*" else ["*"]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=cors_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["*"],  # レスポンスヘッダーを公開
+)
+
+logger.info(f"Imported {__name__} in {(time.perf_counter() - _import_started_at) * 1000:.0f} ms")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
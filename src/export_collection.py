@@ -0,0 +1,217 @@
+"""コレクションの一括エクスポートコマンド
+
+コレクション全体をscrollし、変換済みのpayloadをJSONLまたはParquetに書き出す。
+次ページの取得を別スレッドで先行して行い、現在のページの変換・書き込みと並行させる。
+ページは上限付きのキューで受け渡すため、メモリ使用量はコレクションの大きさに依存しない。
+
+使用例:
+    # CUBEC_NOTEをJSONLに書き出す
+    poetry run python -m src.export_collection CUBEC_NOTE --output cubec_note.jsonl
+
+    # PACKAGE_INSERTをParquetに書き出し、ベクトルを.npyに書き出す
+    poetry run python -m src.export_collection PACKAGE_INSERT --output package_insert.parquet --vectors package_insert.npy
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.app import (
+    CollectionName,
+    PointRecord,
+    _extract_vector,
+    get_qdrant_client,
+    transform_cubec_note_response,
+    transform_gl_response,
+    transform_package_insert_response,
+)
+
+logger = logging.getLogger(__name__)
+
+TRANSFORMS = {
+    CollectionName.CUBEC_NOTE: transform_cubec_note_response,
+    CollectionName.PACKAGE_INSERT: transform_package_insert_response,
+    CollectionName.GUIDELINE: transform_gl_response,
+}
+
+_END = object()
+
+
+def scroll_pages(collection_name: str, batch_size: int, with_vectors: bool, pages: queue.Queue):
+    """コレクションをscrollし、ページをキューに格納する（別スレッドで実行）"""
+    client = get_qdrant_client(collection_name)
+    offset = None
+    try:
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=with_vectors,
+            )
+            pages.put([PointRecord.from_qdrant(point, with_vectors) for point in points])
+            if offset is None:
+                break
+    except Exception as e:
+        pages.put(e)
+    finally:
+        pages.put(_END)
+
+
+class JsonlWriter:
+    def __init__(self, path: str):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self._file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """id列とpayload列（JSON文字列）を持つParquetファイルを書き出す"""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet export requires pyarrow (pip install pyarrow)")
+
+        self._pa = pa
+        self._schema = pa.schema([("id", pa.string()), ("payload", pa.string())])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        table = self._pa.table(
+            {
+                "id": [str(row["id"]) for row in rows],
+                "payload": [json.dumps(row["payload"], ensure_ascii=False) for row in rows],
+            },
+            schema=self._schema,
+        )
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+
+
+def export_collection(
+    collection: CollectionName,
+    output: str,
+    vectors_path: Optional[str] = None,
+    batch_size: int = 1000,
+    prefetch: int = 2,
+    raw: bool = False,
+) -> int:
+    """コレクションを書き出し、書き出したポイント数を返す
+
+    Args:
+        collection: 対象コレクション
+        output: 出力ファイル（拡張子 .parquet の場合はParquet、それ以外はJSONL）
+        vectors_path: ベクトルを書き出す.npyファイル（行の順序は出力ファイルと同じ）
+        batch_size: 1回のscrollで取得するポイント数
+        prefetch: 先行して取得しておくページ数
+        raw: Trueの場合はAPIの形式に変換せず、Qdrantのpayloadをそのまま書き出す
+    """
+    import numpy as np
+
+    collection_name = collection.get_actual_name()
+    transform = TRANSFORMS[collection]
+
+    # memmapの大きさを決めるため、先に件数を取得する
+    total = get_qdrant_client(collection_name).count(collection_name=collection_name, exact=True).count if vectors_path else None
+
+    pages: queue.Queue = queue.Queue(maxsize=prefetch)
+    producer = threading.Thread(
+        target=scroll_pages,
+        args=(collection_name, batch_size, bool(vectors_path), pages),
+        daemon=True,
+    )
+    producer.start()
+
+    writer = ParquetWriter(output) if output.endswith(".parquet") else JsonlWriter(output)
+    vectors = None
+    written = 0
+    missing_vectors = 0
+
+    try:
+        while True:
+            page = pages.get()
+            if page is _END:
+                break
+            if isinstance(page, Exception):
+                raise page
+
+            if vectors_path:
+                # denseベクトルを持たない点（sparseのみのnamed vector等）や次元の異なる点は行を0のまま残す
+                rows = []
+                page_vectors = []
+                for offset, point in enumerate(page):
+                    vector = _extract_vector(point.vector)
+                    if not isinstance(vector, list):
+                        continue
+                    if vectors is None:
+                        vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=(total, len(vector)))
+                    if len(vector) != vectors.shape[1]:
+                        continue
+                    rows.append(written + offset)
+                    page_vectors.append(vector)
+                missing_vectors += len(page) - len(rows)
+                if rows:
+                    vectors[rows] = np.asarray(page_vectors, dtype=np.float32)
+                for point in page:
+                    point.vector = None
+
+            writer.write([{"id": point.id, "payload": point.payload} for point in page] if raw else transform(page))
+            written += len(page)
+            logger.info(f"{collection_name}: exported {written}" + (f" / {total}" if total else ""))
+    finally:
+        writer.close()
+        if vectors is not None:
+            vectors.flush()
+
+    if missing_vectors:
+        logger.warning(f"{missing_vectors} points had no dense vector of the expected dimension; their vector rows are zero")
+    if vectors_path and vectors is None and written:
+        logger.warning(f"No dense vectors found in {collection_name}; {vectors_path} was not written")
+    if total is not None and written != total:
+        logger.warning(f"Exported {written} points but the collection reported {total}; trailing vector rows are zero")
+
+    return written
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO)
+    # 一括処理のため、APIサーバーより長いQdrantクライアントのタイムアウトを使用する
+    os.environ.setdefault("QDRANT_CLIENT_TIMEOUT", "60")
+
+    parser = argparse.ArgumentParser(description="コレクションをJSONL / Parquet / .npyに一括エクスポートする")
+    parser.add_argument("collection", choices=[collection.value for collection in CollectionName])
+    parser.add_argument("--output", required=True, help="出力ファイル（.parquetの場合はParquet、それ以外はJSONL）")
+    parser.add_argument("--vectors", help="ベクトルを書き出す.npyファイル（行の順序は出力ファイルと同じ）")
+    parser.add_argument("--batch-size", type=int, default=1000, help="1回のscrollで取得するポイント数")
+    parser.add_argument("--prefetch", type=int, default=2, help="先行して取得しておくページ数")
+    parser.add_argument("--raw", action="store_true", help="APIの形式に変換せず、Qdrantのpayloadをそのまま書き出す")
+    args = parser.parse_args()
+
+    written = export_collection(
+        CollectionName(args.collection),
+        args.output,
+        vectors_path=args.vectors,
+        batch_size=args.batch_size,
+        prefetch=args.prefetch,
+        raw=args.raw,
+    )
+    print(f"Exported {written} points to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""アプリケーションのインポート時間を計測するコマンド
+
+`python -X importtime` の出力を集計し、累積インポート時間の大きいモジュールを表示する。
+
+使用例:
+    poetry run python -m src.import_profile --top 20
+"""
+import argparse
+import subprocess
+import sys
+
+
+def profile_imports(module: str) -> list:
+    """新しいプロセスでモジュールをインポートし、(累積μs, 自身μs, モジュール名) のリストを返す"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr)
+
+    results = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        results.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="モジュールのインポート時間を計測する")
+    parser.add_argument("--module", default="src.app", help="計測するモジュール（デフォルト: src.app）")
+    parser.add_argument("--top", type=int, default=20, help="表示する件数")
+    args = parser.parse_args()
+
+    results = profile_imports(args.module)
+    total = max((cumulative for cumulative, _, name in results if name.strip() == args.module), default=0)
+    print(f"{args.module}: {total / 1000:.1f} ms")
+    print(f"{'cumulative[ms]':>15} {'self[ms]':>10}  module")
+    for cumulative, self_us, name in sorted(results, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>15.1f} {self_us / 1000:>10.1f}  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
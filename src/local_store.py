@@ -0,0 +1,59 @@
+"""ローカルモード用のQdrantストレージ作成コマンド
+
+リモートのQdrantからコレクションをコピーし、QdrantClient(path=...) で読み込めるストレージを作成する。
+作成したストレージを COLLECTION_<キー>_PATH に指定すると、APIはそのコレクションをネットワークを介さずに読み込む。
+
+使用例:
+    # PACKAGE_INSERTコレクションを ./qdrant_local にコピーする
+    poetry run python -m src.local_store PACKAGE_INSERT --path ./qdrant_local
+
+    # 複数のコレクションを同じストレージにコピーする
+    poetry run python -m src.local_store CUBEC_NOTE PACKAGE_INSERT --path ./qdrant_local
+"""
+import argparse
+import logging
+import os
+import sys
+
+from qdrant_client import QdrantClient
+
+from src.app import CollectionName, get_qdrant_client
+
+logger = logging.getLogger(__name__)
+
+
+def build_local_store(collections: list, path: str, batch_size: int = 256) -> dict:
+    """リモートのQdrantから各コレクションをローカルストレージへコピーし、コピーしたポイント数を返す"""
+    remote = get_qdrant_client()
+    local = QdrantClient(path=path)
+    counts = {}
+    try:
+        for collection in collections:
+            collection_name = collection.get_actual_name()
+            logger.info(f"Copying {collection_name} to {path}")
+            remote.migrate(local, collection_names=[collection_name], batch_size=batch_size, recreate_on_collision=True)
+            counts[collection_name] = local.count(collection_name=collection_name, exact=True).count
+    finally:
+        local.close()
+    return counts
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO)
+    # 一括処理のため、APIサーバーより長いQdrantクライアントのタイムアウトを使用する
+    os.environ.setdefault("QDRANT_CLIENT_TIMEOUT", "60")
+
+    parser = argparse.ArgumentParser(description="リモートのQdrantからローカルモード用のストレージを作成する")
+    parser.add_argument("collections", nargs="+", choices=[collection.value for collection in CollectionName])
+    parser.add_argument("--path", required=True, help="作成するストレージのディレクトリ")
+    parser.add_argument("--batch-size", type=int, default=256, help="1回のコピーで処理するポイント数")
+    args = parser.parse_args()
+
+    counts = build_local_store([CollectionName(key) for key in args.collections], args.path, batch_size=args.batch_size)
+    for collection_name, count in counts.items():
+        print(f"{collection_name}: {count} points")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
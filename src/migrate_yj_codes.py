@@ -0,0 +1,103 @@
+"""YJコード正規化マイグレーション
+
+カンマ区切り文字列の metadata.yj_code を分割し、keyword配列 metadata.yj_codes として書き込む。
+書き込み後に metadata.yj_codes へkeywordインデックスを作成する。
+移行済みのコレクションでは、APIはYJコード検索にMatchAnyによる完全一致を使用する。
+
+使用例:
+    # 変更内容を確認する（書き込みなし）
+    poetry run python -m src.migrate_yj_codes --dry-run
+
+    # PACKAGE_INSERTコレクションを移行する
+    poetry run python -m src.migrate_yj_codes --batch-size 500
+"""
+import argparse
+import logging
+import os
+import sys
+
+from qdrant_client.http.models import PayloadSchemaType, SetPayload, SetPayloadOperation
+
+from src.app import CollectionName, get_qdrant_client, split_yj_codes
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_yj_codes(collection_name: str, batch_size: int = 500, dry_run: bool = False) -> int:
+    """コレクション全体をページ単位でscrollし、metadata.yj_codes を一括書き込みする
+
+    Args:
+        collection_name: 実コレクション名
+        batch_size: 1回のscroll・書き込みで処理するポイント数
+        dry_run: Trueの場合は書き込みを行わず件数のみ数える
+
+    Returns:
+        更新した（dry_runの場合は更新対象の）ポイント数
+    """
+    client = get_qdrant_client()
+    updated = 0
+    scanned = 0
+    offset = None
+
+    while True:
+        # 必要なフィールドだけを取得してペイロード転送量を抑える
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["metadata.yj_code", "metadata.yj_codes"],
+            with_vectors=False,
+        )
+
+        operations = []
+        for point in points:
+            metadata = (point.payload or {}).get("metadata", {})
+            yj_codes = split_yj_codes(metadata.get("yj_code", ""))
+            if metadata.get("yj_codes") == yj_codes:
+                continue
+            operations.append(
+                SetPayloadOperation(
+                    set_payload=SetPayload(payload={"yj_codes": yj_codes}, points=[point.id], key="metadata")
+                )
+            )
+
+        scanned += len(points)
+        if operations and not dry_run:
+            client.batch_update_points(collection_name=collection_name, update_operations=operations, wait=True)
+        updated += len(operations)
+        logger.info(f"{collection_name}: scanned {scanned}, updated {updated}")
+
+        if offset is None:
+            break
+
+    if not dry_run:
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name="metadata.yj_codes",
+            field_schema=PayloadSchemaType.KEYWORD,
+            wait=True,
+        )
+        logger.info(f"Created keyword payload index on {collection_name}.metadata.yj_codes")
+
+    return updated
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO)
+    # 一括処理のため、APIサーバーより長いQdrantクライアントのタイムアウトを使用する
+    os.environ.setdefault("QDRANT_CLIENT_TIMEOUT", "60")
+
+    parser = argparse.ArgumentParser(description="metadata.yj_code を keyword配列 metadata.yj_codes に正規化する")
+    parser.add_argument("--collection", help="実コレクション名（デフォルト: COLLECTION_PACKAGE_INSERT）")
+    parser.add_argument("--batch-size", type=int, default=500, help="1回のscroll・書き込みで処理するポイント数")
+    parser.add_argument("--dry-run", action="store_true", help="書き込みを行わず更新対象の件数のみ表示する")
+    args = parser.parse_args()
+
+    collection_name = args.collection or CollectionName.PACKAGE_INSERT.get_actual_name()
+    updated = migrate_yj_codes(collection_name, batch_size=args.batch_size, dry_run=args.dry_run)
+    print(f"{collection_name}: {updated} points {'to update' if args.dry_run else 'updated'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
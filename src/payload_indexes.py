@@ -0,0 +1,37 @@
+"""フィルター検索用ペイロードインデックスの確認・作成コマンド
+
+使用例:
+    # 不足しているインデックスを確認する
+    poetry run python -m src.payload_indexes
+
+    # 不足しているインデックスを作成する
+    poetry run python -m src.payload_indexes --create
+"""
+import argparse
+import os
+import sys
+
+from src.app import REQUIRED_PAYLOAD_INDEXES, check_payload_indexes
+
+
+def main() -> int:
+    # 一括処理のため、APIサーバーより長いQdrantクライアントのタイムアウトを使用する
+    os.environ.setdefault("QDRANT_CLIENT_TIMEOUT", "60")
+    parser = argparse.ArgumentParser(description="Qdrantのペイロードインデックスを確認・作成する")
+    parser.add_argument("--create", action="store_true", help="不足しているインデックスを作成する")
+    args = parser.parse_args()
+
+    missing = check_payload_indexes(create_missing=args.create)
+
+    for collection, required in REQUIRED_PAYLOAD_INDEXES.items():
+        collection_name = collection.get_actual_name()
+        print(f"[{collection.value}] {collection_name}")
+        for field, schema in required.items():
+            status = "MISSING" if field in missing.get(collection_name, []) else "OK"
+            print(f"  {status:8} {field} ({schema})")
+
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
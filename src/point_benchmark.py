@@ -0,0 +1,167 @@
+"""ポイントの変換・シリアライズの合成ベンチマーク
+
+Qdrantの代わりに合成したRecordを返すクライアントを使用し、
+scroll結果の取得（search_points_by_filters）からレスポンスの変換・JSONシリアライズまでの
+所要時間・ピークメモリと、ポイントの中間表現（変換前のポイントリスト）のメモリを計測する。Qdrantサーバーは不要。
+
+--mode で処理の経路を切り替えて比較できる:
+    current: PointRecord + jsonable_encoderを通さないJSONResponse（現在の経路）
+    jsonable-encoder: PointRecord + jsonable_encoder（FastAPIのデフォルトのシリアライズ）
+    baseline: ポイントごとの中間辞書 + jsonable_encoder（PointRecord導入前の経路）
+
+使用例:
+    poetry run python -m src.point_benchmark --points 10000 --repeat 5
+    poetry run python -m src.point_benchmark --mode baseline
+"""
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+from qdrant_client.http.models import Record
+
+import src.app as app_module
+from fastapi.responses import JSONResponse
+
+from src.app import (
+    CollectionName,
+    json_response,
+    search_points_by_filters,
+    transform_cubec_note_response,
+    transform_package_insert_response,
+)
+
+
+class SyntheticClient:
+    """scroll・retrieveに合成したRecordを返すクライアント"""
+
+    def __init__(self, records):
+        self.records = records
+
+    def scroll(self, collection_name, limit=10, **kwargs):
+        return self.records[:limit], None
+
+    def retrieve(self, collection_name, ids, **kwargs):
+        return self.records[:len(ids)]
+
+
+def make_records(count: int, collection: CollectionName, content_length: int):
+    body = ("本剤の成分に対し過敏症の既往歴のある患者。" * (content_length // 20 + 1))[:content_length]
+    records = []
+    for i in range(count):
+        if collection == CollectionName.PACKAGE_INSERT:
+            metadata = {
+                "yj_code": f"{1000000000 + i % 500}A, {2000000000 + i % 300}B",
+                "section_title": "禁忌",
+                "generic_name": "トリアゾラム",
+                "product_name": f"ハルシオン{i % 7}",
+                "common_name": "トリアゾラム錠",
+                "manufacturer": "製薬会社",
+                "revision_date": "2024-01-01",
+                "document_id": f"doc-{i}",
+                "section_number": 2,
+            }
+            payload = {"page_content": body, "metadata": metadata, "url": f"https://example.com/{i}"}
+        else:
+            metadata = {
+                "main_category": f"疾患{i % 50} -- 章{i % 9}",
+                "disease_name": f"疾患{i % 50}",
+                "sub_category": "概要",
+                "gl_name": ["ガイドラインA", "ガイドラインB"],
+                "gl_link": ["https://example.com/a", "https://example.com/b"],
+            }
+            payload = {"page_content": body, "metadata": metadata}
+        records.append(Record(id=i, payload=payload, vector=None))
+    return records
+
+
+class LegacyPointDict(dict):
+    """PointRecord導入前のポイントごとの中間辞書（{"id", "payload"[, "vector"]}）
+
+    現在の変換処理に渡せるよう、属性としても参照できるようにしている。
+    """
+    id = property(lambda self: self["id"])
+    payload = property(lambda self: self["payload"])
+    vector = property(lambda self: self.get("vector"))
+
+
+def build_points(count: int, mode: str) -> list:
+    """scroll結果からポイントの中間表現を作成する"""
+    if mode != "baseline":
+        return search_points_by_filters(
+            collection_name="benchmark",
+            filters=[{"field": "metadata.disease_name", "value": "疾患", "type": "text"}],
+        )[:count]
+
+    # 変更前のsearch_points_by_filtersと同じくポイントごとに辞書を作成する
+    records, _ = app_module._qdrant_client.scroll(collection_name="benchmark", limit=count)
+    points = []
+    for record in records:
+        point_dict = LegacyPointDict(id=record.id, payload=record.payload if record.payload else {})
+        if record.vector:
+            point_dict["vector"] = record.vector
+        points.append(point_dict)
+    return points
+
+
+def run_pipeline(collection: CollectionName, count: int, mode: str = "current") -> int:
+    points = build_points(count, mode)
+    if collection == CollectionName.PACKAGE_INSERT:
+        transformed = transform_package_insert_response(points, {})
+    else:
+        transformed = transform_cubec_note_response(points)
+    content = {"success": True, "data": transformed, "count": len(transformed)}
+    if mode == "current":
+        return len(json_response(content).body)
+    # FastAPIのデフォルトの経路（jsonable_encoderの結果をJSONResponseでシリアライズ）
+    return len(JSONResponse(content=jsonable_encoder(content)).body)
+
+
+def measure_points_alloc(count: int, mode: str) -> int:
+    """ポイントの中間表現だけに割り当てられたメモリ（バイト）"""
+    tracemalloc.start()
+    points = build_points(count, mode)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del points
+    return current
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ポイントの変換・シリアライズの合成ベンチマーク")
+    parser.add_argument("--points", type=int, default=10000, help="1回の処理で扱うポイント数")
+    parser.add_argument("--content-length", type=int, default=1000, help="page_contentの文字数")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数")
+    parser.add_argument("--mode", choices=["current", "jsonable-encoder", "baseline"], default="current", help="計測する処理の経路")
+    args = parser.parse_args()
+
+    for collection in (CollectionName.PACKAGE_INSERT, CollectionName.CUBEC_NOTE):
+        app_module._qdrant_client = SyntheticClient(make_records(args.points, collection, args.content_length))
+
+        run_pipeline(collection, args.points, args.mode)
+        timings = []
+        for _ in range(args.repeat):
+            started_at = time.perf_counter()
+            run_pipeline(collection, args.points, args.mode)
+            timings.append((time.perf_counter() - started_at) * 1000)
+
+        tracemalloc.start()
+        run_pipeline(collection, args.points, args.mode)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        points_alloc = measure_points_alloc(args.points, args.mode)
+
+        print(
+            f"{collection.value:15} mode={args.mode} points={args.points} "
+            f"median={statistics.median(timings):.1f}ms min={min(timings):.1f}ms peak_alloc={peak / 1024 / 1024:.1f}MiB "
+            f"points_alloc={points_alloc / 1024 / 1024:.2f}MiB"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Qdrantの通信方式（REST / gRPC）のベンチマーク
+
+同じコレクションに対して、REST（JSON）とgRPCでretrieve・scrollを繰り返し実行し、
+1回あたりの所要時間（中央値・p95）を比較する。payload・ベクトルの有無と件数を変えて計測する。
+
+使用例:
+    # PACKAGE_INSERTコレクションで計測する
+    poetry run python -m src.transport_benchmark --collection PACKAGE_INSERT
+
+    # 件数と繰り返し回数を指定する
+    poetry run python -m src.transport_benchmark --collection CUBEC_NOTE --sizes 10 100 1000 --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+from qdrant_client import QdrantClient
+
+from src.app import CollectionName, qdrant_transport_options
+
+
+def measure(func: Callable, repeat: int) -> List[float]:
+    """funcをrepeat回実行し、1回ごとの所要時間（ミリ秒）を返す（初回はウォームアップとして除外）"""
+    func()
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return timings
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Qdrantの通信方式（REST / gRPC）を比較する")
+    parser.add_argument("--collection", default="PACKAGE_INSERT", choices=[collection.value for collection in CollectionName])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="1回で取得するポイント数")
+    parser.add_argument("--repeat", type=int, default=10, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    collection_name = CollectionName(args.collection).get_actual_name()
+    clients = {
+        transport: QdrantClient(
+            url=os.getenv("QDRANT_URL"),
+            api_key=os.getenv("QDRANT_API_KEY"),
+            **qdrant_transport_options(prefer_grpc=transport == "grpc"),
+        )
+        for transport in ("rest", "grpc")
+    }
+
+    # retrieveに使用するIDを先頭から取得しておく
+    ids = [point.id for point in clients["rest"].scroll(
+        collection_name=collection_name, limit=max(args.sizes), with_payload=False, with_vectors=False
+    )[0]]
+
+    variants = [
+        ("payload", True, False),
+        ("payload+vectors", True, True),
+        ("ids only", False, False),
+    ]
+
+    print(f"collection: {collection_name}  repeat: {args.repeat}")
+    print(f"{'operation':10} {'size':>6} {'content':16} {'rest p50':>10} {'grpc p50':>10} {'rest p95':>10} {'grpc p95':>10} {'speedup':>8}")
+    for size in args.sizes:
+        for label, with_payload, with_vectors in variants:
+            operations = {
+                "retrieve": lambda client: client.retrieve(
+                    collection_name=collection_name, ids=ids[:size], with_payload=with_payload, with_vectors=with_vectors
+                ),
+                "scroll": lambda client: client.scroll(
+                    collection_name=collection_name, limit=size, with_payload=with_payload, with_vectors=with_vectors
+                ),
+            }
+            for operation, call in operations.items():
+                results = {
+                    transport: measure(lambda: call(client), args.repeat) for transport, client in clients.items()
+                }
+                rest_p50 = statistics.median(results["rest"])
+                grpc_p50 = statistics.median(results["grpc"])
+                print(
+                    f"{operation:10} {size:>6} {label:16} "
+                    f"{rest_p50:>8.1f}ms {grpc_p50:>8.1f}ms "
+                    f"{percentile(results['rest'], 0.95):>8.1f}ms {percentile(results['grpc'], 0.95):>8.1f}ms "
+                    f"{rest_p50 / grpc_p50:>7.2f}x"
+                )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+流入制御（AdmissionLimiter）のテストスクリプト
+
+サーバーを起動せず、イベントループ上で実行枠の確保・解放・引き渡しを確認する。
+"""
+
+import asyncio
+
+from src.app import AdmissionLimiter
+
+
+async def check_priority_ordering():
+    print("\n[テスト] 優先リクエストの順序")
+    limiter = AdmissionLimiter(limit=1, queue_size=10)
+    assert await limiter.acquire(False, timeout=1)
+    assert limiter.would_queue()
+
+    order = []
+
+    async def request(name, priority):
+        assert await limiter.acquire(priority, timeout=1)
+        order.append(name)
+        await asyncio.sleep(0)
+        limiter.release()
+
+    tasks = [
+        asyncio.create_task(request("normal-1", False)),
+        asyncio.create_task(request("normal-2", False)),
+        asyncio.create_task(request("priority", True)),
+    ]
+    await asyncio.sleep(0)
+    limiter.release()
+    await asyncio.gather(*tasks)
+    assert order == ["priority", "normal-1", "normal-2"], order
+    assert limiter.active == 0
+    print("✅ 優先リクエストが先に実行枠を得る")
+
+
+async def check_queue_full():
+    print("\n[テスト] 待ち行列の上限")
+    limiter = AdmissionLimiter(limit=1, queue_size=1)
+    assert await limiter.acquire(False, timeout=1)
+    waiting = asyncio.create_task(limiter.acquire(False, timeout=1))
+    await asyncio.sleep(0)
+    assert not await limiter.acquire(True, timeout=1)
+    limiter.release()
+    assert await waiting
+    limiter.release()
+    assert limiter.active == 0
+    print("✅ 待ち行列が満杯の場合は待たずにFalse")
+
+
+async def check_timeout():
+    print("\n[テスト] 待ち時間切れ")
+    limiter = AdmissionLimiter(limit=1, queue_size=10)
+    assert await limiter.acquire(False, timeout=1)
+    assert not await limiter.acquire(False, timeout=0.05)
+    # 待ち時間切れのリクエストは待ち行列から除かれ、解放で実行枠が戻る
+    assert not any(limiter._waiters.values())
+    limiter.release()
+    assert limiter.active == 0
+    assert not limiter.would_queue()
+    print("✅ 待ち時間切れで待ち行列から除去")
+
+
+async def check_cancel_while_waiting():
+    print("\n[テスト] 待機中のキャンセル")
+    limiter = AdmissionLimiter(limit=1, queue_size=10)
+    assert await limiter.acquire(False, timeout=1)
+    waiting = asyncio.create_task(limiter.acquire(False, timeout=1))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    try:
+        await waiting
+    except asyncio.CancelledError:
+        pass
+    assert not any(limiter._waiters.values())
+    limiter.release()
+    assert limiter.active == 0
+    print("✅ キャンセルしたリクエストは待ち行列から除去")
+
+
+async def check_cancel_after_hand_off():
+    print("\n[テスト] 引き渡し直後のキャンセル")
+    limiter = AdmissionLimiter(limit=1, queue_size=10)
+    assert await limiter.acquire(False, timeout=1)
+    first = asyncio.create_task(limiter.acquire(False, timeout=1))
+    second = asyncio.create_task(limiter.acquire(False, timeout=1))
+    await asyncio.sleep(0)
+
+    # firstに実行枠を引き渡した直後（firstが再開する前）にキャンセルする
+    limiter.release()
+    first.cancel()
+    try:
+        acquired = await first
+    except asyncio.CancelledError:
+        acquired = False
+    # Python 3.11以前のwait_forは、完了済みの場合キャンセルを無視して結果を返す（その場合は呼び出し側が解放する）
+    if acquired:
+        limiter.release()
+    assert await second
+    assert limiter.active == 1
+    limiter.release()
+    assert limiter.active == 0
+    print("✅ 引き渡された実行枠は次のリクエストに渡る")
+
+
+async def check_service_time():
+    print("\n[テスト] 処理時間の見積もり")
+    limiter = AdmissionLimiter(limit=1, queue_size=10)
+    assert limiter.estimated_wait() == 0.0
+    assert await limiter.acquire(False, timeout=1)
+    limiter.release(elapsed=2.0, route="/api/cubec-note/page")
+    assert limiter.service_time > 0
+    assert limiter.route_service_times["/api/cubec-note/page"] > 0
+
+    assert await limiter.acquire(False, timeout=1)
+    assert limiter.would_queue()
+    assert limiter.estimated_wait() == limiter.service_time
+    limiter.release()
+    print("✅ 処理時間の移動平均から待ち時間を見積もる")
+
+
+def test_admission_control():
+    print("=" * 70)
+    print("流入制御 テスト")
+    print("=" * 70)
+
+    for check in (
+        check_priority_ordering,
+        check_queue_full,
+        check_timeout,
+        check_cancel_while_waiting,
+        check_cancel_after_hand_off,
+        check_service_time,
+    ):
+        asyncio.run(check())
+
+    print("\n" + "=" * 70)
+    print("テスト完了")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    test_admission_control()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+キャッシュバックエンド（memory / sqlite / redis）のテストスクリプト
+
+Redisバックエンドは、このスクリプト内で起動するRESPプロトコルの簡易サーバーに対してテストする。
+"""
+
+import os
+import socketserver
+import tempfile
+import threading
+import time
+
+from src.app import RedisCacheBackend, SQLiteCacheBackend, TTLCache
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """GET / SET（PX） / SCAN / DEL / AUTH のみを実装したRedis互換の簡易サーバー"""
+
+    store = {}
+    password = "secret"
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def bulk(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        data = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def handle(self):
+        while True:
+            args = self.read_command()
+            if args is None:
+                break
+            command = args[0].upper()
+            if command == "GET":
+                value, expires_at = self.store.get(args[1], (None, None))
+                if expires_at is not None and time.time() >= expires_at:
+                    value = None
+                self.wfile.write(self.bulk(value))
+            elif command == "SET":
+                expires_at = time.time() + int(args[4]) / 1000 if len(args) > 4 else None
+                self.store[args[1]] = (args[2], expires_at)
+                self.wfile.write(b"+OK\r\n")
+            elif command == "SCAN":
+                prefix = args[3].rstrip("*")
+                keys = [key for key in self.store if key.startswith(prefix)]
+                self.wfile.write(b"*2\r\n" + self.bulk("0") + b"*%d\r\n" % len(keys) + b"".join(self.bulk(key) for key in keys))
+            elif command == "AUTH":
+                self.wfile.write(b"+OK\r\n" if args[1] == self.password else b"-ERR invalid password\r\n")
+            elif command == "DEL":
+                for key in args[1:]:
+                    self.store.pop(key, None)
+                self.wfile.write(b":%d\r\n" % (len(args) - 1))
+            else:
+                self.wfile.write(b"+OK\r\n")
+
+
+def check_backend(name, cache, expire_cache):
+    print(f"\n[テスト] {name}")
+
+    cache.set("3399004M1425", ["https://example.com/a", "https://example.com/b"])
+    cache.set(("collection", 1), {"id": 1, "payload": {"page_content": "禁忌"}})
+    assert cache.get("3399004M1425") == ["https://example.com/a", "https://example.com/b"]
+    assert cache.get(("collection", 1)) == {"id": 1, "payload": {"page_content": "禁忌"}}
+    assert cache.get("missing") is None
+    print("✅ set / get")
+
+    assert cache.get_many(["3399004M1425", "missing"]) == {"3399004M1425": ["https://example.com/a", "https://example.com/b"]}
+    print("✅ get_many")
+
+    expire_cache.set("key", "value")
+    time.sleep(0.2)
+    assert expire_cache.get("key") is None
+    print("✅ TTL切れ")
+
+    cache.clear()
+    assert cache.get("3399004M1425") is None
+    print("✅ clear")
+
+
+def test_cache_backends():
+    print("=" * 70)
+    print("キャッシュバックエンド テスト")
+    print("=" * 70)
+
+    check_backend("memory", TTLCache(ttl=60, max_entries=100), TTLCache(ttl=0.1, max_entries=100))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cache.sqlite3")
+        check_backend(
+            "sqlite",
+            SQLiteCacheBackend(path, "test", ttl=60, max_entries=100),
+            SQLiteCacheBackend(path, "expire", ttl=0.1, max_entries=100),
+        )
+        # 別インスタンス（別ワーカー相当）から同じ値が読めること
+        SQLiteCacheBackend(path, "shared", ttl=60, max_entries=100).set("key", [1, 2])
+        assert SQLiteCacheBackend(path, "shared", ttl=60, max_entries=100).get("key") == [1, 2]
+        print("✅ インスタンス間での共有")
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeRedisHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"redis://127.0.0.1:{server.server_address[1]}/0"
+        check_backend("redis", RedisCacheBackend(url, "test", ttl=60), RedisCacheBackend(url, "expire", ttl=0.1))
+
+        # 認証に失敗した接続を再利用しないこと（ミスとして扱い、次回は接続し直す）
+        port = server.server_address[1]
+        cache = RedisCacheBackend(f"redis://:wrong@127.0.0.1:{port}/0", "auth", ttl=60)
+        assert cache.get("key") is None
+        assert getattr(cache._local, "conn", None) is None
+        cache.password = "secret"
+        cache.set("key", "value")
+        assert cache.get("key") == "value"
+        print("✅ 認証失敗時の再接続")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print("\n" + "=" * 70)
+    print("テスト完了")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    test_cache_backends()
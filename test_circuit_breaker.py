@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+医薬品URL取得API用サーキットブレーカー（CircuitBreaker）のテストスクリプト
+"""
+
+import time
+
+from src.app import CircuitBreaker
+
+
+def test_circuit_breaker():
+    print("=" * 70)
+    print("サーキットブレーカー テスト")
+    print("=" * 70)
+
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.1)
+
+    print("\n[テスト] closed → open")
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    print("✅ 成功で連続失敗数がリセットされる")
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    print("✅ 連続失敗がしきい値に達するとopen")
+
+    print("\n[テスト] half-open")
+    time.sleep(0.15)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert not breaker.allow()
+    print("✅ half-openではプローブを1件のみ許可")
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    print("✅ プローブが失敗するとopenに戻る")
+
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+    assert breaker.allow()
+    print("✅ プローブが成功するとclosedに戻る")
+
+    print("\n" + "=" * 70)
+    print("テスト完了")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    test_circuit_breaker()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+ファセット取得APIのテストスクリプト
+"""
+
+import requests
+
+BASE_URL = "http://localhost:7860"
+
+def test_facets():
+    """ファセット取得APIのテスト"""
+    print("=" * 70)
+    print("ファセット取得API テスト")
+    print("=" * 70)
+
+    # テストケース1: 疾患名一覧
+    print("\n[テスト1] CUBEC_NOTE疾患名一覧")
+    response = requests.get(f"{BASE_URL}/api/cubec-note/facets/diseases", timeout=60)
+    if response.status_code == 200:
+        data = response.json()
+        print(f"✅ ステータス: {response.status_code}")
+        print(f"   疾患数: {data['count']}")
+        for item in data["data"][:5]:
+            print(f"   - {item['value']} ({item['count']}件)")
+    else:
+        print(f"❌ エラー: ステータスコード {response.status_code}")
+        print(f"   {response.text}")
+
+    # テストケース2: 疾患ごとのタイトル一覧
+    print("\n[テスト2] CUBEC_NOTEタイトル一覧 - 疾患名: WPW症候群")
+    response = requests.get(
+        f"{BASE_URL}/api/cubec-note/facets/titles",
+        params={"disease": "WPW症候群"},
+        timeout=60
+    )
+    if response.status_code == 200:
+        data = response.json()
+        print(f"✅ ステータス: {response.status_code}")
+        for item in data["data"]:
+            print(f"   - {item['value']} ({item['count']}件)")
+    else:
+        print(f"❌ エラー: ステータスコード {response.status_code}")
+
+    # テストケース3: 医薬品ごとのセクションタイトル一覧
+    print("\n[テスト3] PACKAGE_INSERTセクション一覧 - YJコード: 3399004M1425")
+    response = requests.get(
+        f"{BASE_URL}/api/package-insert/facets/sections",
+        params={"yj_code": "3399004M1425"},
+        timeout=60
+    )
+    if response.status_code == 200:
+        data = response.json()
+        print(f"✅ ステータス: {response.status_code}")
+        for item in data["data"]:
+            print(f"   - {item['value']} ({item['count']}件)")
+        has_content = any("context" in item or "page_content" in item for item in data["data"])
+        print(f"   本文を含まない: {'✅' if not has_content else '❌'}")
+    else:
+        print(f"❌ エラー: ステータスコード {response.status_code}")
+
+    print("\n" + "=" * 70)
+    print("テスト完了")
+    print("=" * 70)
+
+if __name__ == "__main__":
+    test_facets()
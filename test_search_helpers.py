@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+再ランキング・オートコンプリート・スニペット・ETagの補助関数のテストスクリプト
+
+サーバー・Qdrantを使用せずに確認できる関数のみを対象とする。
+"""
+
+import unicodedata
+
+from src.app import (
+    PointRecord,
+    PrefixIndex,
+    RerankMode,
+    build_snippet,
+    compute_etag,
+    etag_matches,
+    normalize_for_autocomplete,
+    rerank_points,
+)
+
+
+def check_rerank():
+    print("\n[テスト] 再ランキング")
+    points = [
+        PointRecord(1, {}, [1.0, 0.0]),
+        PointRecord(2, {}, [0.99, 0.01]),  # 1とほぼ同じ
+        PointRecord(3, {}, [0.0, 1.0]),
+        PointRecord(4, {}, None),  # ベクトルなし
+    ]
+
+    result = rerank_points(points, RerankMode.DEDUP, threshold=0.95)
+    assert [point.id for point in result] == [1, 3, 4]
+    print("✅ dedup: 類似度がしきい値以上のポイントを除去し、ベクトルなしは末尾")
+
+    result = rerank_points(points, RerankMode.MMR, top_k=2, lambda_mult=0.5)
+    assert [point.id for point in result] == [1, 3]
+    print("✅ mmr: 類似したポイントより異なるポイントを優先")
+
+    result = rerank_points(points, RerankMode.MMR, top_k=1, query_vector=[0.0, 1.0])
+    assert [point.id for point in result] == [3]
+    print("✅ mmr: query_vectorとの類似度を関連度に使用")
+
+    named = [PointRecord(1, {}, {"dense": [1.0, 0.0]}), PointRecord(2, {}, {"dense": [1.0, 0.0]})]
+    assert [point.id for point in rerank_points(named, RerankMode.DEDUP)] == [1]
+    print("✅ named vector")
+
+    for bad_points, query_vector in (
+        ([PointRecord(1, {}, [1.0, 0.0]), PointRecord(2, {}, [1.0, 0.0, 0.0])], None),
+        (points, [1.0, 0.0, 0.0]),
+    ):
+        try:
+            rerank_points(bad_points, RerankMode.MMR, query_vector=query_vector)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("次元の不一致でValueErrorにならない")
+    print("✅ 次元の不一致はValueError")
+
+
+def check_autocomplete():
+    print("\n[テスト] オートコンプリート")
+    assert normalize_for_autocomplete("ハルシオン") == "はるしおん"
+    assert normalize_for_autocomplete("ﾊﾙｼｵﾝ") == "はるしおん"
+    assert normalize_for_autocomplete("ＷＰＷ 症候群") == "wpw症候群"
+    print("✅ 正規化（NFKC・大文字小文字・カタカナ・空白）")
+
+    index = PrefixIndex([
+        (normalize_for_autocomplete(value), value, "product_name")
+        for value in ["ハルシオン錠0.25mg", "ハルシオン錠0.125mg", "ハルナール", "バイアスピリン"]
+    ] + [(normalize_for_autocomplete("ハルシオン錠0.25mg"), "ハルシオン錠0.25mg", "product_name")])
+    assert len(index) == 4
+    assert [entry[1] for entry in index.search(normalize_for_autocomplete("ﾊﾙｼ"), 10)] == ["ハルシオン錠0.125mg", "ハルシオン錠0.25mg"]
+    assert len(index.search(normalize_for_autocomplete("はる"), 2)) == 2
+    assert index.search(normalize_for_autocomplete("ロキソニン"), 10) == []
+    print("✅ 前方一致検索（重複除去・件数制限）")
+
+
+def check_snippet():
+    print("\n[テスト] スニペット")
+    text = "ＷＰＷ症候群の患者ではｶﾞｲﾄﾞﾗｲﾝに従う"
+    terms = [term.lower() for term in unicodedata.normalize("NFKC", "wpw ガイドライン").split()]
+    result = build_snippet(text, terms, length=120)
+    assert result["snippet"] == text
+    assert [result["snippet"][start:end] for start, end in result["highlights"]] == ["ＷＰＷ", "ｶﾞｲﾄﾞﾗｲﾝ"]
+    print("✅ 全角・半角の表記揺れを元の本文の位置で強調")
+
+    text = "İ" * 5 + "禁忌" + "あ" * 200
+    result = build_snippet(text, ["禁忌"], length=40)
+    assert [result["snippet"][start:end] for start, end in result["highlights"]] == ["禁忌"]
+    assert result["snippet"].endswith("…")
+    print("✅ 小文字化で長さが変わる文字があっても位置がずれない")
+
+
+def check_etag():
+    print("\n[テスト] ETag")
+    etag = compute_etag("POST", "/api/search", "", '{"q": "禁忌", "limit": 10}'.encode())
+    assert etag == compute_etag("POST", "/api/search", "", '{"limit":10,"q":"禁忌"}'.encode())
+    assert etag != compute_etag("POST", "/api/search", "", '{"q": "副作用", "limit": 10}'.encode())
+    assert etag != compute_etag("POST", "/api/cubec-note/page", "", '{"q": "禁忌", "limit": 10}'.encode())
+    assert compute_etag("GET", "/collections", "a=1&b=2", b"") == compute_etag("GET", "/collections", "b=2&a=1", b"")
+    print("✅ JSONのキー順序・クエリの順序に依存しない")
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    print("✅ If-None-Matchの比較（リスト・弱いETag・*）")
+
+
+def test_search_helpers():
+    print("=" * 70)
+    print("補助関数 テスト")
+    print("=" * 70)
+
+    check_rerank()
+    check_autocomplete()
+    check_snippet()
+    check_etag()
+
+    print("\n" + "=" * 70)
+    print("テスト完了")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    test_search_helpers()